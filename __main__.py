@@ -78,7 +78,7 @@ def main():
     # Initialize the logger
     log_file = os.path.join(store_manager.current_dir.path, "oma.log")
     logger = new_logger(log_file, log_level)
-    logger.debug(f"Using configuration file: {args.config}")
+    logger.debug("Using configuration file: %s", args.config)
     if args.debug:
         logger.debug("Debug mode enabled via command line argument")
 
@@ -109,9 +109,9 @@ def main():
 
     # Clean up before doing the backup, if desired
     if config.delete_before:
-        logger.debug(f"Removing old backup directories before new backup. Will keep {config.versions} versions ...")
+        logger.debug("Removing old backup directories before new backup. Will keep %d versions ...", config.versions)
         removed = store_manager.cleanup_before(config.versions)
-        logger.info(f"Removed old backup directories: {removed}")
+        logger.info("Removed old backup directories: %s", removed)
 
     # Do the backup
     logger.info("Performing the backup now ...")
@@ -129,9 +129,9 @@ def main():
 
     # Clean up after doing the backup, if desired
     if not config.delete_before:
-        logger.debug(f"Removing old backup directories after current backup. Will keep {config.versions} versions ...")
+        logger.debug("Removing old backup directories after current backup. Will keep %d versions ...", config.versions)
         removed = store_manager.cleanup_after(config.versions)
-        logger.info(f"Removed old backup directories: {removed}")
+        logger.info("Removed old backup directories: %s", removed)
 
     # Execute terminate conditions
     if not conditions_manager.execute_terminate_conditions(store_manager.current_dir.path):
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 import os
 import multiprocessing
+import shutil
 
 # Try to import tomllib (Python 3.11+), fall back to tomli if not available
 try:
@@ -21,14 +22,14 @@ except ModuleNotFoundError:
             raise ImportError("TOML parsing library not found. Please install python3-toml from Debian repositories.")
 
 
-@dataclass
+@dataclass(frozen=True)
 class ZbxConfig:
     item_key: str
     sender_bin: str
     agent_conf: str
 
 
-@dataclass
+@dataclass(frozen=True)
 class ConditionsConfig:
     skip_conditions: list[str]
     skip_conditions_timeout: int
@@ -38,7 +39,7 @@ class ConditionsConfig:
     terminate_conditions_timeout: int
 
 
-@dataclass
+@dataclass(frozen=True)
 class Config:
     backup_dir: str
     parallelism: int
@@ -46,7 +47,8 @@ class Config:
     delete_before: bool
     mysqldump_bin: str
     mysql_bin: str
-    mysqldump_options: list[str]
+    compressor_bin: str
+    mysqldump_options: tuple[str, ...]
     exclude_databases: list[str]
     do_databases: list[str]
     log_level: str
@@ -57,9 +59,34 @@ class Config:
     conditions: ConditionsConfig
 
 
+# Parsed configurations, keyed by path, modification time and size of the config file
+_CONFIG_CACHE: dict[tuple, Config] = {}
+
+
+def _resolve_bin(setting: str, executable: str) -> str:
+    """
+    Resolve an executable to its absolute path, so a missing binary is reported once at startup.
+
+    Args:
+        setting: Name of the setting, used in the error message
+        executable: Configured executable, either a path or a name looked up in PATH
+
+    Returns:
+        Absolute path of the executable
+
+    Raises:
+        ValueError: If the executable doesn't exist or isn't executable
+    """
+    resolved = shutil.which(executable)
+    if resolved is None:
+        raise ValueError(f"Executable for '{setting}' not found: {executable}")
+    return os.path.abspath(resolved)
+
+
 def get_config(config_file: str) -> Config:
     """
-    Read the config toml file and return a Config object
+    Read the config toml file and return a Config object.
+    Parsed configurations are cached until the file is modified.
 
     Args:
         config_file: Path to the TOML configuration file
@@ -69,11 +96,16 @@ def get_config(config_file: str) -> Config:
 
     Raises:
         FileNotFoundError: If the config file doesn't exist
-        ValueError: If required settings are missing
+        ValueError: If required settings are missing or a configured executable isn't found
     """
     if not os.path.isfile(config_file):
         raise FileNotFoundError(f"Configuration file not found: {config_file}")
 
+    stat = os.stat(config_file)
+    cache_key = (os.path.realpath(config_file), stat.st_mtime_ns, stat.st_size)
+    if cache_key in _CONFIG_CACHE:
+        return _CONFIG_CACHE[cache_key]
+
     # Read the TOML file
     try:
         # Try text mode first (for Debian 11)
@@ -119,6 +151,8 @@ def get_config(config_file: str) -> Config:
     if not os.path.isdir(backup_dir):
         raise ValueError(f"Backup directory does not exist: {backup_dir}")
 
+    compressor_bin = main_config.get("compressor_bin", shutil.which("pigz") or "")
+
     # Set defaults and override with values from config file
     config = Config(
         backup_dir=backup_dir,
@@ -129,13 +163,15 @@ def get_config(config_file: str) -> Config:
         # Default: False
         delete_before=main_config.get("delete_before", False),
         # Default: "mysqldump" (in PATH)
-        mysqldump_bin=main_config.get("mysqldump_bin", "mysqldump"),
+        mysqldump_bin=_resolve_bin("mysqldump_bin", main_config.get("mysqldump_bin", "mysqldump")),
         # Default: "mysql" (in PATH)
-        mysql_bin=main_config.get("mysql_bin", "mysql"),
+        mysql_bin=_resolve_bin("mysql_bin", main_config.get("mysql_bin", "mysql")),
+        # Default: "pigz" if found in PATH, else "" (compress with built-in gzip)
+        compressor_bin=compressor_bin and _resolve_bin("compressor_bin", compressor_bin),
         # Default: "hard"
         link_type=link_type,
         # Default: empty list
-        mysqldump_options=main_config.get("mysqldump_options", []),
+        mysqldump_options=tuple(main_config.get("mysqldump_options", [])),
         # Default: empty list
         exclude_databases=main_config.get("exclude_databases", []),
         # Default: empty list
@@ -176,4 +212,5 @@ def get_config(config_file: str) -> Config:
     if config.exclude_databases and config.do_databases:
         raise ValueError("Mutually exclusive values: cannot specify both 'exclude_databases' and 'do_databases'")
 
+    _CONFIG_CACHE[cache_key] = config
     return config
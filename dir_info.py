@@ -1,6 +1,4 @@
-import subprocess
 from dataclasses import dataclass
-from datetime import datetime
 import os
 import shutil
 
@@ -37,70 +35,86 @@ def get_dir_info(dir_path) -> DirInfo:
 
 def get_dir_size(dir_path: str) -> int:
     """
-    Return the dir size aka bytes used of a directory
-    :param dir_path:
-    :return:
+    Return the dir size aka bytes used of a directory.
+    Like 'du -s', the disk space allocated by all files and directories is summed up
+    and files with multiple hard links are counted only once.
+    Files and directories vanishing during the walk are skipped.
+
+    Args:
+        dir_path: Path to the directory
+
+    Returns:
+        int: Bytes used by the directory tree
+
+    Raises:
+        FileNotFoundError: If the directory doesn't exist
     """
-    # Execute du -sb <dir_path>
-    # -s: summarize - display only a total for the directory
-    # -k: kilobytes - print size in kilobytes
-    result = subprocess.run(
-        ['du', '-sk', dir_path],
-        capture_output=True,
-        text=True,
-        check=True,  # Raise CalledProcessError on non-zero exit status
-        encoding='utf-8'
-    )
-    # Output is typically "SIZE\tPATH"
-    output = result.stdout.strip()
-    if not output:
-        raise ValueError(f"'du -sk {dir_path}' produced empty output.")
-    dir_size_str = output.split()[0]
+    bytes_used = os.stat(dir_path).st_blocks * 512
+    seen_inodes = set()
+    dirs = [dir_path]
+    while dirs:
+        current_dir = dirs.pop()
+        try:
+            entries = os.scandir(current_dir)
+        except FileNotFoundError:
+            if current_dir == dir_path:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if stat.st_nlink > 1 and not is_dir:
+                    inode = (stat.st_dev, stat.st_ino)
+                    if inode in seen_inodes:
+                        continue
+                    seen_inodes.add(inode)
+                bytes_used += stat.st_blocks * 512
+                if is_dir:
+                    dirs.append(entry.path)
 
-    return int(dir_size_str) * 1024
+    return bytes_used
 
 
-def get_dir_last_change(dir_path: str) -> datetime:
+def get_dir_fingerprint(dir_path: str) -> tuple[int, int]:
     """
-    Descents into the folder and examines the change time of all files.
-    Returns the datetime of the most recently changed file inside the folder.
+    Return a fingerprint of the files inside a directory tree.
+    The fingerprint changes if a file is modified, added or removed.
+    Files vanishing during the walk are skipped.
 
     Args:
-        dir_path: Path to the directory to examine
+        dir_path: Path to the directory
 
     Returns:
-        datetime: The timestamp of the most recently changed file
+        tuple: Latest modification time in nanoseconds and total size in bytes of all files
 
     Raises:
-        FileNotFoundError: If the directory doesn't exist or is empty
+        FileNotFoundError: If the directory doesn't exist
     """
-    if not os.path.exists(dir_path):
-        raise FileNotFoundError(f"Directory does not exist: {dir_path}")
-
-    # Use a safe datetime that works on both 32-bit and 64-bit systems
-    latest_time = datetime(1900, 1, 1, 0, 0, 0)
-
-    for root, dirs, files in os.walk(dir_path):
-        # Check modification time of all files in this directory
-        for file in files:
-            file_path = os.path.join(root, file)
-            # Skip symbolic links to avoid potential issues
-            if not os.path.islink(file_path):
+    latest_mtime_ns = 0
+    total_size = 0
+    dirs = [dir_path]
+    while dirs:
+        current_dir = dirs.pop()
+        try:
+            entries = os.scandir(current_dir)
+        except FileNotFoundError:
+            if current_dir == dir_path:
+                raise
+            continue
+        with entries:
+            for entry in entries:
                 try:
-                    # Get the modification time
-                    mtime = os.path.getmtime(file_path)
-                    try:
-                        mtime_dt = datetime.fromtimestamp(mtime)
-                    except (OSError, OverflowError, ValueError):
-                        # On 32-bit systems, timestamps outside the valid range will fail
-                        # Skip this file if we can't convert its timestamp
-                        continue
-
-                    # Update latest_time if this file is more recent
-                    if mtime_dt > latest_time:
-                        latest_time = mtime_dt
-                except (OSError, FileNotFoundError):
-                    # Skip files that can't be accessed
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        latest_mtime_ns = max(latest_mtime_ns, stat.st_mtime_ns)
+                        total_size += stat.st_size
+                except FileNotFoundError:
                     continue
 
-    return latest_time
+    return latest_mtime_ns, total_size
@@ -1,5 +1,34 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that doesn't flush the log file after every record.
+    The file is flushed on records with a level of flush_level or above, on flush() and on close().
+    """
+
+    def __init__(self, filename, mode='a', buffer_size=64 * 1024, flush_level=logging.ERROR):
+        self.buffer_size = buffer_size
+        self.flush_level = flush_level
+        super().__init__(filename, mode)
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size, encoding=self.encoding,
+                    errors=self.errors)
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= self.flush_level:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
 
 
 class OmaLogger(logging.Logger):
@@ -8,12 +37,37 @@ class OmaLogger(logging.Logger):
     def __init__(self, name, level=logging.NOTSET):
         super().__init__(name, level)
         self.log_file = None
+        self.listener = None
+
+    def flush(self):
+        """Write all queued and buffered records to the log file"""
+        if self.listener:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.flush()
+            self.listener.start()
+
+    def stop_listener(self):
+        """Write all queued records, stop the background thread and close its handlers"""
+        if self.listener:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
 
-    def read_log(self):
-        """Read and return the content of the log file"""
+    def read_log(self, size: int = -1):
+        """
+        Read and return the content of the log file.
+        If size is not negative, at most size bytes are read and decoded, ending with the last complete line.
+        """
+        self.flush()
         if self.log_file and os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return f.read()
+            with open(self.log_file, 'rb') as f:
+                content = f.read(size)
+            if 0 <= size == len(content):
+                # Don't return a line (or character) cut off by the size limit
+                content = content[:content.rfind(b'\n') + 1]
+            return content.decode('utf-8', errors='replace')
         return ""
 
 
@@ -21,6 +75,7 @@ def new_logger(log_file: str = "", log_level: str = "info") -> OmaLogger:
     """
     Create a new logger. If log_file is not given, logs are printed to stdout.
     If log_file exists, it will be overwritten. Logs are NOT appended to existing files.
+    Records for the log file are queued and written by a background thread through a buffered file handler.
     :param log_file: Path to log file, if empty logs go to stdout only
     :param log_level: Log level (debug, info, warning, error)
     :return: Configured logging instance
@@ -45,6 +100,7 @@ def new_logger(log_file: str = "", log_level: str = "info") -> OmaLogger:
     logger.setLevel(level)
 
     # Clear any existing handlers
+    logger.stop_listener()
     if logger.handlers:
         logger.handlers.clear()
 
@@ -53,10 +109,16 @@ def new_logger(log_file: str = "", log_level: str = "info") -> OmaLogger:
 
     # Create file handler if log_file is specified
     if log_file:
-        file_handler = logging.FileHandler(log_file, mode='w')
+        file_handler = BufferedFileHandler(log_file, mode='w')
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        # Hand records over to a background thread that writes them to the file
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.setLevel(level)
+        logger.addHandler(queue_handler)
+        logger.listener = logging.handlers.QueueListener(log_queue, file_handler)
+        logger.listener.start()
     else:
         # add a console handler
         console_handler = logging.StreamHandler()
@@ -67,3 +129,11 @@ def new_logger(log_file: str = "", log_level: str = "info") -> OmaLogger:
     logger.info(f"Logger initialized with level: {log_level}")
 
     return logger
+
+
+@atexit.register
+def _stop_listener():
+    """Write all queued records to the log file on exit"""
+    logger = logging.Logger.manager.loggerDict.get('oma')
+    if isinstance(logger, OmaLogger):
+        logger.stop_listener()
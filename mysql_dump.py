@@ -1,19 +1,56 @@
+import logging
 import os
 import re
 import subprocess
-import tempfile
+import threading
 from dataclasses import dataclass
 
 from config import Config
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from mysql_info import MySQLInfo
 from store_manager import StoreManager
 from logger import OmaLogger
 
-from utils import format_bytes, calc_parallelism
+from utils import format_bytes, calc_parallelism, calc_compressor_threads, drop_file_cache
 from datetime import datetime
 
+# Use the much faster ISA-L based gzip implementation (python3-isal), fall back to gzip if not available
+try:
+    from isal import igzip as gzip_lib
+
+    # Default level of igzip, trading a slightly larger file than gzip level 6 for much faster compression
+    GZIP_COMPRESS_LEVEL = 2
+except ModuleNotFoundError:
+    import gzip as gzip_lib
+
+    GZIP_COMPRESS_LEVEL = 6
+
+# Chunk size used to read the mysqldump output
+DUMP_READ_SIZE = 256 * 1024
+# Buffer size of the compressed output file
+DUMP_WRITE_BUFFER_SIZE = 256 * 1024
+# Amount of dump data read between advising the kernel to drop the written part of the dump file from the page cache
+DUMP_DROP_CACHE_SIZE = 64 * 1024 * 1024
+# Number of trailing bytes kept to find the completion message
+DUMP_TAIL_SIZE = 4096
+# Number of trailing bytes of mysqldump's stderr kept for the log
+DUMP_STDERR_SIZE = 64 * 1024
+# Last line of a complete dump, matched against the raw bytes of the dump
+DUMP_COMPLETED_RE = re.compile(rb"^-- Dump completed on \d{4}-\d{2}-\d{2}\s+\d+:\d{2}:\d{2}")
+
+
+def keep_tail(tail: bytes, chunk: bytes, size: int = DUMP_TAIL_SIZE) -> bytes:
+    """
+    Append a chunk to the tail buffer and return the last size bytes.
+    Only the end of the chunk is copied, so large chunks don't cause large copies.
+    :param tail: Current tail buffer
+    :param chunk: Chunk read from the stream
+    :param size: Maximum size of the tail buffer
+    :return: New tail buffer
+    """
+    return (tail + chunk[-size:])[-size:]
+
 
 class NotEnoughDiskSpaceError(Exception):
     """Exception raised when backup wouldn't fit in disk space"
@@ -37,6 +74,25 @@ class BackupResult:
     all_skipped_faulty: bool = False
 
 
+def read_stream_tail(stream, result: list):
+    """
+    Read a binary stream until EOF and append its last DUMP_STDERR_SIZE bytes to result.
+    Used to drain stderr of a process in a thread while stdout is being read.
+    Memory stays bounded no matter how much the process writes.
+    :param stream: Binary stream to read
+    :param result: List the tail of the stream is appended to
+    :return: None
+    """
+    tail = b""
+    try:
+        while chunk := stream.read(DUMP_READ_SIZE):
+            tail = keep_tail(tail, chunk, DUMP_STDERR_SIZE)
+    except (OSError, ValueError):
+        # The stream has been closed because the dump was aborted
+        pass
+    result.append(tail)
+
+
 class MySQLDump:
     def __init__(self, config: Config, store_manager: StoreManager, logger: OmaLogger):
         self.logger = logger
@@ -44,15 +100,18 @@ class MySQLDump:
         self.store_manager = store_manager
         store_manager.link_type = config.link_type
         self.mysql_info = MySQLInfo(mysql_bin=config.mysql_bin)
+        self.compressor_threads = 1
 
     def execute(self) -> BackupResult:
         """
         Execute the mysqldump command in parallel, according to the configured parallelism
         :return:
         """
-        self.logger.debug(f"MySQL data directory: {self.mysql_info.data_dir}")
-        self.logger.debug(f"Found {len(self.mysql_info.databases)} databases: {', '.join(self.mysql_info.databases)}")
-        self.logger.info(f"Skip unchanged databases: {self.config.skip_unchanged_dbs}")
+        self.logger.debug("MySQL data directory: %s", self.mysql_info.data_dir)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Found %d databases: %s",
+                              len(self.mysql_info.databases), ', '.join(self.mysql_info.databases))
+        self.logger.info("Skip unchanged databases: %s", self.config.skip_unchanged_dbs)
 
         # Generate list of databases to be backed up.
         databases = []
@@ -65,10 +124,10 @@ class MySQLDump:
                 if db in self.mysql_info.databases:
                     databases.append(db)
                 else:
-                    self.logger.warning(f"Database '{db}' specified in do_databases does not exist.")
+                    self.logger.warning("Database '%s' specified in do_databases does not exist.", db)
             # Skip all other databases
             skip = [d for d in self.mysql_info.databases if d not in self.config.do_databases]
-            self.logger.info(f"Backing up only specified databases: {self.config.do_databases}")
+            self.logger.info("Backing up only specified databases: %s", self.config.do_databases)
         else:
             # Use the exclude logic
             for d in self.mysql_info.databases:
@@ -77,24 +136,40 @@ class MySQLDump:
                 else:
                     databases.append(d)
             if len(self.config.exclude_databases) > 0:
-                self.logger.info(f"Excluding databases {self.config.exclude_databases} from backup job.")
+                self.logger.info("Excluding databases %s from backup job.", self.config.exclude_databases)
             for e in self.config.exclude_databases:
                 if e not in self.mysql_info.databases:
-                    self.logger.warning(f"Database to be excluded '{e}' does not exist.")
+                    self.logger.warning("Database to be excluded '%s' does not exist.", e)
 
         # Exit, if we don't have enough free space
         self.logger.debug("Checking for free disk space...")
-        if not self._check_free_space(databases):
+        database_sizes = self.mysql_info.get_databases_sizes(databases)
+        if not self._check_free_space(database_sizes):
             return BackupResult()
 
+        # Dump the largest databases first, so the small ones fill up the idle workers at the end
+        databases.sort(key=lambda d: database_sizes[d], reverse=True)
+
         parallelism = calc_parallelism(self.config.parallelism)
-        with ProcessPoolExecutor(max_workers=parallelism) as executor:
+        cpu_count = os.cpu_count() or 1
+        if parallelism > cpu_count:
+            self.logger.warning(
+                "Reducing parallelism from %d to %d: more parallel dumps than CPUs only fight for the CPU",
+                parallelism, cpu_count)
+            parallelism = cpu_count
+        if parallelism > len(databases):
+            self.logger.debug(
+                "Reducing parallelism from %d to %d: not more parallel dumps than databases",
+                parallelism, max(1, len(databases)))
+            parallelism = max(1, len(databases))
+        self.compressor_threads = calc_compressor_threads(parallelism)
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
             self.logger.info(
-                f"Will start {parallelism} parallel mysqldump processes using "
-                f"options {self.config.mysqldump_options}")
-            # Submit all database dump tasks
-            future_to_db = {executor.submit(self._mysqldump_to_gzip, database): database for database in
-                            databases}
+                "Will start %d parallel mysqldump processes using options %s",
+                parallelism, self.config.mysqldump_options)
+            # Submit all database dump tasks. Each worker looks at its database right before dumping it,
+            # a database waiting in the queue may still change.
+            future_to_db = {executor.submit(self._mysqldump_to_gzip, database): database for database in databases}
 
             # Process results as they complete
             success_count = 0
@@ -104,20 +179,20 @@ class MySQLDump:
                     result = future.result()
                     if result:
                         success_count += 1
-                        self.logger.info(f"DB '{database}': Backup successfully")
+                        self.logger.info("DB '%s': Backup successfully", database)
                     else:
-                        self.logger.error(f"Failed to dump database: {database}")
+                        self.logger.error("Failed to dump database: %s", database)
                 except Exception as exc:
-                    self.logger.error(f"DB '{database}': Backup failed: {exc}")
+                    self.logger.error("DB '%s': Backup failed: %s", database, exc)
 
             failed = len(databases) - success_count
             if failed == 0:
                 self.logger.info(
-                    f"Successfully dumped {success_count} of {len(self.mysql_info.databases)}, "
-                    f"failed {failed} databases")
+                    "Successfully dumped %d of %d, failed %d databases",
+                    success_count, len(self.mysql_info.databases), failed)
             else:
                 self.logger.error(
-                    f"Backing up all databases: Expected {len(self.mysql_info.databases)}, got {success_count}")
+                    "Backing up all databases: Expected %d, got %d", len(self.mysql_info.databases), success_count)
 
         self.store_manager.store_backup_info(self.mysql_info.data_dir.bytes_used)
         self.store_manager.link_to_last_dir()
@@ -128,121 +203,174 @@ class MySQLDump:
             total=len(self.mysql_info.databases),
         )
 
-    def _check_free_space(self, databases: list[str]) -> bool:
+    def _check_free_space(self, database_sizes: dict[str, int]) -> bool:
+        """
+        Check if the dumps of the databases will fit into the free space of the current backup directory.
+        :param database_sizes: dict mapping each database to be dumped to its size in bytes
+        :return: True if there is enough free space
+        """
         previous_dump_info = self.store_manager.get_backup_info()
         # Check if we have enough free disk space for the backup
-        required_free_bytes = self.mysql_info.get_databases_size(databases) * previous_dump_info.compression_ratio
+        required_free_bytes = sum(database_sizes.values()) * previous_dump_info.compression_ratio
         self.logger.info(
-            f"Backup will require {format_bytes(required_free_bytes)} bytes. "
-            + f"Having {format_bytes(self.store_manager.current_dir.bytes_free)} free."
+            "Backup will require %s bytes. Having %s free.",
+            format_bytes(required_free_bytes), format_bytes(self.store_manager.current_dir.bytes_free)
         )
         if required_free_bytes > self.store_manager.current_dir.bytes_free:
             raise NotEnoughDiskSpaceError("Not enough free space in target directory.")
         return True
 
     def _mysqldump_to_gzip(self, database: str):
-
+        """
+        Dump a database to a gzip file in the current backup directory.
+        If skip_unchanged_dbs is enabled and the database hasn't changed since the previous backup,
+        the previous backup is reused. A database is unchanged if the fingerprint of its table files
+        matches the one stored by the previous backup, or, lacking a fingerprint, if it has not been
+        modified since the previous backup.
+        :param database: Name of the database
+        :return: Path to the dump file, or "ok" if the previous backup has been reused
+        """
         output_file = os.path.join(self.store_manager.current_dir.path, f"{database}.sql.gz")
 
+        fingerprint = None
         if self.config.skip_unchanged_dbs:
+            # Take the fingerprint first, the last change is derived from it
+            fingerprint = self.mysql_info.get_database_fingerprint(database)
             database_last_change = self.mysql_info.get_database_last_change(database)
-            database_dir_age = datetime.now() - database_last_change
             previous_dump_time = self.store_manager.get_database_backup_time(database)
-            previous_dump_age = datetime.now() - previous_dump_time
-            self.logger.debug(
-                f"DB '{database}' last change: {database_last_change} "
-                + f"({database_dir_age.seconds} sec. ago)")
-            self.logger.debug(
-                f"DB '{database}' previous backup: {previous_dump_time} "
-                + f"({previous_dump_age.seconds} sec. ago)")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                now = datetime.now()
+                database_dir_age = now - database_last_change
+                previous_dump_age = now - previous_dump_time
+                self.logger.debug(
+                    "DB '%s' last change: %s (%d sec. ago)",
+                    database, database_last_change, database_dir_age.seconds)
+                self.logger.debug(
+                    "DB '%s' previous backup: %s (%d sec. ago)",
+                    database, previous_dump_time, previous_dump_age.seconds)
+
+            previous_fingerprint = self.store_manager.get_database_fingerprint(database)
+            if previous_fingerprint is not None:
+                # No table file has been modified, added or removed since the previous dump started
+                unchanged = previous_fingerprint == fingerprint
+            else:
+                # The previous backup has no fingerprint, compare the times instead
+                unchanged = previous_dump_time > database_last_change
 
-            if previous_dump_time > database_last_change:
-                self.logger.info(f"DB '{database}': Backup is newer than last database change. Reusing previous backup")
+            if unchanged:
+                self.logger.info(
+                    "DB '%s': Backup is newer than last database change. Reusing previous backup", database)
                 try:
                     self.store_manager.reuse_previous_backup(database)
+                    self.store_manager.store_database_fingerprint(database, fingerprint)
                 except Exception as exc:
-                    self.logger.error(f"DB '{database}': Moving previous backup to current directory: {exc}")
+                    self.logger.error("DB '%s': Moving previous backup to current directory: %s", database, exc)
                 return "ok"
 
-        # Create a temporary file for the last line of the output
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_path = temp_file.name
-
         try:
-            self.store_manager.store_database_backup_time(database)
-            # Base mysqldump command
-            mysqldump_base = f"mysqldump {database} {' '.join(self.config.mysqldump_options)}"
-
-            # Construct the full command
-            cmd = (
-                f"bash -c '{mysqldump_base} | "
-                f"tee >(tail -n 1 > {temp_path}) | "
-                f"gzip -c > {output_file}'"
-            )
-
-            self.logger.debug(f"Executing command: {cmd}")
-
-            # Execute the command
-            with subprocess.Popen(
-                    cmd,
-                    stderr=subprocess.PIPE,
-                    shell=True,
-            ) as process:
-
-                # Wait for completion
-                _, stderr = process.communicate()
-                stderr_text = stderr.decode('utf-8') if stderr else ""
+            # Changes during the dump may be missing from it, so the dump counts from its start
+            dump_start = datetime.now()
+            cmd = [self.config.mysqldump_bin, database, *self.config.mysqldump_options]
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Executing command: %s", ' '.join(cmd))
+
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+                # Drain stderr while the dump is read, a full stderr pipe would block mysqldump
+                stderr_tail = []
+                stderr_reader = threading.Thread(
+                    target=read_stream_tail, args=(process.stderr, stderr_tail), daemon=True)
+                stderr_reader.start()
+                with open(output_file, 'wb', buffering=DUMP_WRITE_BUFFER_SIZE) as f:
+                    if self.config.compressor_bin:
+                        tail = self._compress_external(process.stdout, f)
+                    else:
+                        tail = self._compress_gzip(process.stdout, f)
+                    f.flush()
+                    # A single sync for the complete file, so all of its pages can be dropped
+                    drop_file_cache(f.fileno(), sync=True)
+                stderr_reader.join()
+                process.wait()
+                stderr = b"".join(stderr_tail)
+                stderr_text = stderr.decode('utf-8', errors='replace') if stderr else ""
 
                 if process.returncode != 0:
-                    self.logger.error(f"mysqldump failed with return code {process.returncode}: {stderr_text}")
-                    raise Exception(f"mysqldump pipeline failed: {stderr_text}")
-
-            # Check for completion message in the last line
-            # Handle potential encoding issues when reading the temp file
-            dump_completion_line = ""
-            try:
-                with open(temp_path, 'r', encoding='utf-8', errors='replace') as f:
-                    dump_completion_line = f.read().strip()
-            except Exception as e:
-                self.logger.warning(f"Failed to read temp file with UTF-8 encoding, trying binary mode: {e}")
-                try:
-                    with open(temp_path, 'rb') as f:
-                        content = f.read()
-                        # Try multiple encodings
-                        for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                            try:
-                                dump_completion_line = content.decode(encoding).strip()
-                                self.logger.debug(f"Successfully decoded temp file using {encoding} encoding")
-                                break
-                            except UnicodeDecodeError:
-                                continue
-                        if not dump_completion_line:
-                            # Last resort: ignore errors
-                            dump_completion_line = content.decode('utf-8', errors='ignore').strip()
-                            self.logger.warning("Used UTF-8 with ignore errors to read temp file")
-                except Exception as e:
-                    self.logger.error(f"Failed to read temp file even in binary mode: {e}")
-                    raise Exception(f"Could not read mysqldump completion status: {e}")
+                    self.logger.error("mysqldump failed with return code %d: %s", process.returncode, stderr_text)
+                    raise Exception(f"mysqldump failed: {stderr_text}")
+
+            # Get the last line of the dump
+            tail_lines = tail.strip().splitlines()
+            dump_completion_line = tail_lines[-1].strip() if tail_lines else b""
 
             # Check for errors on stderr of mysqldump process
             if len(stderr_text) > 0:
-                self.logger.error(f"mysqldump for DB '{database}' stderr: {stderr_text}")
+                self.logger.error("mysqldump for DB '%s' stderr: %s", database, stderr_text)
             # Check if the last line matches the pattern indicating the dump completion timestamp
-            dump_completed_pattern = re.compile(r"^-- Dump completed on \d{4}-\d{2}-\d{2}\s+\d+:\d{2}:\d{2}")
-            if not dump_completed_pattern.match(dump_completion_line):
-                self.logger.error(
-                    f"Completion message not found for db '{database}'.")
+            if not DUMP_COMPLETED_RE.match(dump_completion_line):
+                self.logger.error("Completion message not found for db '%s'.", database)
                 raise Exception("mysqldump did not complete successfully: no completion message found")
 
-            self.logger.info(f"Database dump completed successfully: {output_file}")
+            # Only a complete dump may be reused by the next backup
+            self.store_manager.store_database_backup_time(database, dump_start)
+            if fingerprint is not None:
+                self.store_manager.store_database_fingerprint(database, fingerprint)
+            self.logger.info("Database dump completed successfully: %s", output_file)
             return output_file
 
         except Exception as e:
-            self.logger.exception(f"Error during database dump: {e}")
+            self.logger.exception("Error during database dump: %s", e)
             raise
 
-        finally:
-            # Clean up
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                self.logger.debug(f"Temporary file {temp_path} removed")
+    @staticmethod
+    def _compress_gzip(source, f) -> bytes:
+        """
+        Compress the source stream into the file f using the built-in gzip module, or igzip if installed.
+        Only the last bytes of the stream are kept in memory to validate the completion message.
+        :param source: Binary stream to read the dump from
+        :param f: Binary file to write the compressed dump to
+        :return: The last DUMP_TAIL_SIZE bytes of the uncompressed stream
+        """
+        tail = b""
+        bytes_read = 0
+        with gzip_lib.GzipFile(fileobj=f, mode='wb', compresslevel=GZIP_COMPRESS_LEVEL) as gz:
+            while chunk := source.read(DUMP_READ_SIZE):
+                gz.write(chunk)
+                tail = keep_tail(tail, chunk)
+                bytes_read += len(chunk)
+                if bytes_read >= DUMP_DROP_CACHE_SIZE:
+                    # The dump is not read again, don't let it push the database out of the page cache
+                    f.flush()
+                    drop_file_cache(f.fileno())
+                    bytes_read = 0
+        return tail
+
+    def _compress_external(self, source, f) -> bytes:
+        """
+        Compress the source stream into the file f using the configured compressor_bin, e.g. pigz.
+        :param source: Binary stream to read the dump from
+        :param f: Binary file to write the compressed dump to
+        :return: The last DUMP_TAIL_SIZE bytes of the uncompressed stream
+        """
+        cmd = [self.config.compressor_bin, '-c']
+        if os.path.basename(self.config.compressor_bin) == 'pigz':
+            cmd += ['-p', str(self.compressor_threads)]
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Compressing with: %s", ' '.join(cmd))
+
+        tail = b""
+        try:
+            bytes_read = 0
+            with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=f) as compressor:
+                while chunk := source.read(DUMP_READ_SIZE):
+                    compressor.stdin.write(chunk)
+                    tail = keep_tail(tail, chunk)
+                    bytes_read += len(chunk)
+                    if bytes_read >= DUMP_DROP_CACHE_SIZE:
+                        # The compressor writes to the same file, drop what has been written back so far
+                        drop_file_cache(f.fileno())
+                        bytes_read = 0
+        except BrokenPipeError:
+            # The compressor exited early, its return code is checked below
+            pass
+        if compressor.returncode != 0:
+            raise Exception(f"{self.config.compressor_bin} failed with return code {compressor.returncode}")
+        return tail
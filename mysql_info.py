@@ -1,8 +1,15 @@
 import os.path
+import re
 import subprocess
 from datetime import datetime
 
-from dir_info import get_dir_last_change, get_dir_info
+from dir_info import get_dir_info, get_dir_fingerprint, get_dir_size
+
+
+# Names that need no encoding, which are most database names
+_SAFE_NAME_RE = re.compile(r'\A[A-Za-z0-9_]+\Z')
+# Characters MySQL encodes in directory names, mapped to their @xxxx representation
+_ENCODE_TABLE = {ord(char): f'@{ord(char):04x}' for char in '-. $!#%&()*+,/:;<=>?@[\\]^{|}~'}
 
 
 def encode_database_name(name: str) -> str:
@@ -20,121 +27,83 @@ def encode_database_name(name: str) -> str:
     Returns:
         The encoded name as it appears on the filesystem
     """
-    # Process each character individually to avoid double-encoding issues
-    encoded = []
-
-    for char in name:
-        # Check if this character needs encoding
-        if char == '-':
-            encoded.append('@002d')  # Hyphen/dash
-        elif char == '.':
-            encoded.append('@002e')  # Period
-        elif char == ' ':
-            encoded.append('@0020')  # Space
-        elif char == '$':
-            encoded.append('@0024')  # Dollar sign
-        elif char == '!':
-            encoded.append('@0021')  # Exclamation mark
-        elif char == '#':
-            encoded.append('@0023')  # Hash/pound
-        elif char == '%':
-            encoded.append('@0025')  # Percent
-        elif char == '&':
-            encoded.append('@0026')  # Ampersand
-        elif char == '(':
-            encoded.append('@0028')  # Left parenthesis
-        elif char == ')':
-            encoded.append('@0029')  # Right parenthesis
-        elif char == '*':
-            encoded.append('@002a')  # Asterisk
-        elif char == '+':
-            encoded.append('@002b')  # Plus
-        elif char == ',':
-            encoded.append('@002c')  # Comma
-        elif char == '/':
-            encoded.append('@002f')  # Forward slash
-        elif char == ':':
-            encoded.append('@003a')  # Colon
-        elif char == ';':
-            encoded.append('@003b')  # Semicolon
-        elif char == '<':
-            encoded.append('@003c')  # Less than
-        elif char == '=':
-            encoded.append('@003d')  # Equals
-        elif char == '>':
-            encoded.append('@003e')  # Greater than
-        elif char == '?':
-            encoded.append('@003f')  # Question mark
-        elif char == '@':
-            encoded.append('@0040')  # At sign
-        elif char == '[':
-            encoded.append('@005b')  # Left square bracket
-        elif char == '\\':
-            encoded.append('@005c')  # Backslash
-        elif char == ']':
-            encoded.append('@005d')  # Right square bracket
-        elif char == '^':
-            encoded.append('@005e')  # Caret
-        elif char == '{':
-            encoded.append('@007b')  # Left curly brace
-        elif char == '|':
-            encoded.append('@007c')  # Pipe
-        elif char == '}':
-            encoded.append('@007d')  # Right curly brace
-        elif char == '~':
-            encoded.append('@007e')  # Tilde
-        else:
-            # Keep the character as-is
-            encoded.append(char)
-
-    return ''.join(encoded)
+    if _SAFE_NAME_RE.match(name):
+        return name
+    # Each character is replaced at most once, so there is no double-encoding
+    return name.translate(_ENCODE_TABLE)
 
 
 class MySQLInfo:
     def __init__(self, mysql_bin='mysql'):
         self.mysql_bin = mysql_bin
-        self.data_dir = get_dir_info(self.get_data_dir())
-        self.databases = self.get_databases()
+        data_dir, self.databases = self._query_server()
+        self.data_dir = get_dir_info(data_dir)
+        # Sizes and fingerprints are read from the filesystem only once per database
+        self._size_cache: dict[str, int] = {}
+        self._fingerprint_cache: dict[str, tuple[int, int]] = {}
+
+    def _query_server(self) -> tuple[str, list]:
+        """
+        Query the data directory and the databases with a single call of the mysql client.
+        Executes "mysql -N -e "SELECT @@datadir; SHOW DATABASES""
+        :return: Path to the MySQL data directory and list of databases without the system databases
+        """
+        cmd = [self.mysql_bin, "-N", "-e", "SELECT @@datadir; SHOW DATABASES"]
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+        # The first line is the data directory, followed by one line per database
+        lines = result.stdout.strip().split('\n')
+        data_dir = lines[0].strip()
+        databases = [db.strip() for db in lines[1:] if db.strip()]
+        # Filter out system databases
+        system_dbs = ['information_schema', 'sys', 'performance_schema']
+        databases = [db for db in databases if db not in system_dbs]
+
+        return data_dir, databases
 
     def get_data_dir(self) -> str:
         """
-        Get the MySQL data directory path by querying the MySQL server.
+        Get the MySQL data directory path as queried from the MySQL server.
 
         Returns:
             str: Path to the MySQL data directory
         """
-        # Execute SQL query to get the data directory
-        cmd = [self.mysql_bin, "-N", "-e", "SELECT @@datadir"]
-
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-
-        # Return the output to get the data directory path
-        # Typically, the output will be a single line with the path
-        return result.stdout.strip()
+        return self.data_dir.path
 
     def get_databases(self) -> list:
         """
-        Get list of all databases.
-        Executes "mysql -e "show databases" -N"
+        Get list of all databases as queried from the MySQL server, without the system databases.
         :return: list
         """
-
-        # Execute the MySQL command to show databases
-        cmd = [self.mysql_bin, "-e", "show databases", "-N"]
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-
-        # Split the output by newlines and filter out empty strings
-        databases = [db.strip() for db in result.stdout.split('\n') if db.strip()]
-        # Filter out system databases
-        system_dbs = ['information_schema', 'sys', 'performance_schema']
-        databases = [db for db in databases if db not in system_dbs]
-
-        return databases
+        return list(self.databases)
 
     def get_database_last_change(self, database: str) -> datetime:
-        encoded_name = encode_database_name(database)
-        database_dir = os.path.join(self.data_dir.path, encoded_name)
-        return get_dir_last_change(database_dir)
+        """
+        Get the latest modification time of the table files of the database.
+        It is taken from the fingerprint, so the database directory is walked only once.
+        :param database: Name of the database
+        :return: datetime of the most recently changed file, 1900-01-01 if there is none
+        """
+        latest_mtime_ns, _ = self.get_database_fingerprint(database)
+        try:
+            if latest_mtime_ns > 0:
+                return datetime.fromtimestamp(latest_mtime_ns / 1_000_000_000)
+        except (OSError, OverflowError, ValueError):
+            # Timestamps outside the valid range fail on 32-bit systems
+            pass
+        return datetime(1900, 1, 1, 0, 0, 0)
+
+    def get_database_fingerprint(self, database: str) -> tuple[int, int]:
+        """
+        Get a fingerprint of the table files of the database, see get_dir_fingerprint().
+        :param database: Name of the database
+        :return: Latest modification time in nanoseconds and total size in bytes of the table files
+        """
+        if database not in self._fingerprint_cache:
+            encoded_name = encode_database_name(database)
+            database_dir = os.path.join(self.data_dir.path, encoded_name)
+            self._fingerprint_cache[database] = get_dir_fingerprint(database_dir)
+        return self._fingerprint_cache[database]
 
     def get_database_size(self, database: str) -> int:
         """
@@ -142,10 +111,28 @@ class MySQLInfo:
         :param database:
         :return:
         """
-        encoded_name = encode_database_name(database)
-        database_dir = os.path.join(self.data_dir.path, encoded_name)
-        info = get_dir_info(database_dir)
-        return info.bytes_used
+        if database not in self._size_cache:
+            encoded_name = encode_database_name(database)
+            database_dir = os.path.join(self.data_dir.path, encoded_name)
+            self._size_cache[database] = get_dir_size(database_dir)
+        return self._size_cache[database]
+
+    def get_databases_sizes(self, databases: list[str]) -> dict[str, int]:
+        """
+        Get the size of each database in bytes.
+        The data directory is listed once to find the directories of all databases.
+        :param databases: list of databases
+        :return: dict mapping each database to its size in bytes
+        """
+        wanted = {encode_database_name(d): d for d in databases if d not in self._size_cache}
+        if wanted:
+            with os.scandir(self.data_dir.path) as entries:
+                for entry in entries:
+                    database = wanted.get(entry.name)
+                    if database is not None and entry.is_dir(follow_symlinks=False):
+                        self._size_cache[database] = get_dir_size(entry.path)
+        # Databases without a directory are looked up one by one, which raises an error for them
+        return {database: self.get_database_size(database) for database in databases}
 
     def get_databases_size(self, databases: list[str]) -> int:
         """
@@ -153,7 +140,4 @@ class MySQLInfo:
         :param list of databases:
         :return: size in bytes
         """
-        size = 0
-        for database in databases:
-            size += self.get_database_size(database)
-        return size
+        return sum(self.get_databases_sizes(databases).values())
@@ -5,6 +5,7 @@ import glob
 import re
 import json
 from dataclasses import dataclass
+from typing import Optional
 
 from dir_info import get_dir_info, DirInfo
 from utils import swap_file_for_link
@@ -30,6 +31,8 @@ class StoreManager:
         """
         self.backup_dir = backup_dir
         self.link_type = 'hard'
+        # Cached list of backup directories, see _get_backup_dirs()
+        self._backup_dirs = None
 
         # Ensure base directory exists
         if not os.path.exists(backup_dir):
@@ -47,6 +50,8 @@ class StoreManager:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
         current_dir = os.path.join(backup_dir, f"{DIR_PREFIX}_{timestamp}")
         os.makedirs(current_dir, exist_ok=True)
+        if current_dir not in self._backup_dirs:
+            self._backup_dirs.append(current_dir)
         self.current_dir = get_dir_info(os.path.join(backup_dir, f"{DIR_PREFIX}_{timestamp}"))
 
     def store_backup_info(self, mysql_data_dir_bytes_used: int):
@@ -96,6 +101,8 @@ class StoreManager:
         log_file = os.path.join(self.current_dir.path, 'oma.log')
         os.rename(log_file, os.path.join(self.backup_dir, 'last.log'))
         shutil.rmtree(self.current_dir.path)
+        if self._backup_dirs and self.current_dir.path in self._backup_dirs:
+            self._backup_dirs.remove(self.current_dir.path)
 
     def get_backup_info(self) -> MySQLDumpInfo:
         try:
@@ -115,10 +122,40 @@ class StoreManager:
         except FileNotFoundError:
             return datetime(1900, 1, 1, 0, 0, 0)
 
-    def store_database_backup_time(self, database: str):
+    def store_database_backup_time(self, database: str, backup_time: Optional[datetime] = None):
+        """
+        Store the time a database has been dumped in the current backup directory.
+        :param database: Name of the database
+        :param backup_time: Time the dump started, defaults to now
+        :return:
+        """
         timestamp_file = os.path.join(self.current_dir.path, database + '.timestamp')
         with open(timestamp_file, "w+") as f:
-            f.write(datetime.now().isoformat())
+            f.write((backup_time or datetime.now()).isoformat())
+
+    def get_database_fingerprint(self, database: str) -> Optional[tuple[int, int]]:
+        """
+        Get the fingerprint of a database taken when it was dumped by the previous backup.
+        :param database: Name of the database
+        :return: The fingerprint or None if the previous backup has no fingerprint of the database
+        """
+        try:
+            fingerprint_file = os.path.join(self.previous_dir.path, database + '.fingerprint')
+            with open(fingerprint_file, "r") as f:
+                return tuple(json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def store_database_fingerprint(self, database: str, fingerprint: tuple[int, int]):
+        """
+        Store the fingerprint of a database in the current backup directory.
+        :param database: Name of the database
+        :param fingerprint: Fingerprint as returned by MySQLInfo.get_database_fingerprint()
+        :return:
+        """
+        fingerprint_file = os.path.join(self.current_dir.path, database + '.fingerprint')
+        with open(fingerprint_file, "w") as f:
+            json.dump(list(fingerprint), f)
 
     def cleanup_before(self, versions: int) -> list[str]:
         removed = self._cleanup(versions)
@@ -147,7 +184,17 @@ class StoreManager:
 
     def _get_backup_dirs(self):
         """
-        Returns a list of sub directories in backup_dir, oldest first
+        Returns a list of sub directories in backup_dir, oldest first.
+        The backup_dir is listed only once, the list is kept up to date when directories are added or removed.
+        :return:
+        """
+        if self._backup_dirs is None:
+            self._backup_dirs = self._list_backup_dirs()
+        return list(self._backup_dirs)
+
+    def _list_backup_dirs(self):
+        """
+        Lists the sub directories in backup_dir, oldest first
         :return:
         """
         # Get all potential backup directories
@@ -174,6 +221,7 @@ class StoreManager:
             # Remove each directory
             for old_dir in dirs_to_remove:
                 shutil.rmtree(old_dir)
+                self._backup_dirs.remove(old_dir)
                 removed.append(old_dir)
 
         return removed
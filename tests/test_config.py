@@ -1,32 +1,41 @@
+import dataclasses
 import unittest
 import os
 import tempfile
 from unittest.mock import patch
 import shutil
+import config
 from config import get_config
 
 
+def fake_which(executable):
+    """Pretend that every executable is installed in /usr/bin."""
+    return executable if os.path.isabs(executable) else f"/usr/bin/{executable}"
+
+
 class TestConfig(unittest.TestCase):
     """Test cases for the config module."""
 
-    def setUp(self):
-        """Set up test environment before each test."""
-        # Create a temporary directory for test files
-        self.test_dir = tempfile.mkdtemp()
-        self.backup_dir = os.path.join(self.test_dir, "backups")
-        os.makedirs(self.backup_dir, exist_ok=True)
+    @classmethod
+    def setUpClass(cls):
+        """Create the config files shared by all tests, they must not be modified."""
+        # Create a temporary directory for the read-only config files shared by all tests
+        cls.fixture_dir = tempfile.mkdtemp()
+        cls.backup_dir = os.path.join(cls.fixture_dir, "backups")
+        os.makedirs(cls.backup_dir, exist_ok=True)
 
         # Create a valid config file for testing
-        self.valid_config_path = os.path.join(self.test_dir, "valid_config.toml")
-        with open(self.valid_config_path, "w") as f:
+        cls.valid_config_path = os.path.join(cls.fixture_dir, "valid_config.toml")
+        with open(cls.valid_config_path, "w") as f:
             f.write(f"""
 [main]
-backup_dir = "{self.backup_dir}"
+backup_dir = "{cls.backup_dir}"
 parallelism = 2
 versions = 3
 delete_before = true
 mysqldump_bin = "/usr/bin/mysqldump"
 mysql_bin = "/usr/bin/mysql"
+compressor_bin = "/usr/bin/pigz"
 mysqldump_options = ["--single-transaction", "--quick"]
 exclude_databases = ["demo1", "demo2"]
 log_level = "debug"
@@ -37,37 +46,53 @@ agent_conf = "/tmp/zabbix_agent.conf"
 """)
 
         # Create a minimal config file
-        self.minimal_config_path = os.path.join(self.test_dir, "minimal_config.toml")
-        with open(self.minimal_config_path, "w") as f:
+        cls.minimal_config_path = os.path.join(cls.fixture_dir, "minimal_config.toml")
+        with open(cls.minimal_config_path, "w") as f:
             f.write(f"""
 [main]
-backup_dir = "{self.backup_dir}"
+backup_dir = "{cls.backup_dir}"
 """)
 
         # Create an invalid config file (missing main section)
-        self.invalid_config_path = os.path.join(self.test_dir, "invalid_config.toml")
-        with open(self.invalid_config_path, "w") as f:
+        cls.invalid_config_path = os.path.join(cls.fixture_dir, "invalid_config.toml")
+        with open(cls.invalid_config_path, "w") as f:
             f.write("""
 [settings]
 backup_dir = "/tmp"
 """)
 
         # Create a config with missing required field
-        self.missing_required_path = os.path.join(self.test_dir, "missing_required.toml")
-        with open(self.missing_required_path, "w") as f:
+        cls.missing_required_path = os.path.join(cls.fixture_dir, "missing_required.toml")
+        with open(cls.missing_required_path, "w") as f:
             f.write("""
 [main]
 parallelism = 2
 """)
 
         # Create a config with invalid backup_dir
-        self.invalid_dir_path = os.path.join(self.test_dir, "invalid_dir.toml")
-        with open(self.invalid_dir_path, "w") as f:
+        cls.invalid_dir_path = os.path.join(cls.fixture_dir, "invalid_dir.toml")
+        with open(cls.invalid_dir_path, "w") as f:
             f.write("""
 [main]
 backup_dir = "/path/that/does/not/exist"
 """)
 
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the shared config files."""
+        shutil.rmtree(cls.fixture_dir)
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        which_patcher = patch('shutil.which', side_effect=fake_which)
+        self.mock_which = which_patcher.start()
+        self.addCleanup(which_patcher.stop)
+        # Parse the shared config files again with the mocks of each test
+        config._CONFIG_CACHE.clear()
+
+        # Create a temporary directory for config files written by a single test
+        self.test_dir = tempfile.mkdtemp()
+
     def tearDown(self):
         """Clean up after each test."""
         # Remove the temporary directory and all its contents
@@ -84,7 +109,8 @@ backup_dir = "/path/that/does/not/exist"
         self.assertTrue(config.delete_before)
         self.assertEqual(config.mysqldump_bin, "/usr/bin/mysqldump")
         self.assertEqual(config.mysql_bin, "/usr/bin/mysql")
-        self.assertEqual(config.mysqldump_options, ["--single-transaction", "--quick"])
+        self.assertEqual(config.compressor_bin, "/usr/bin/pigz")
+        self.assertEqual(config.mysqldump_options, ("--single-transaction", "--quick"))
         self.assertEqual(config.exclude_databases, ['demo1', 'demo2'])
         self.assertEqual(config.log_level, "debug")
         self.assertEqual(config.skip_unchanged_dbs, False)
@@ -104,11 +130,53 @@ backup_dir = "/path/that/does/not/exist"
         self.assertEqual(config.parallelism, multiprocessing.cpu_count())
         self.assertEqual(config.versions, 1)
         self.assertFalse(config.delete_before)
-        self.assertEqual(config.mysqldump_bin, "mysqldump")
-        self.assertEqual(config.mysql_bin, "mysql")
-        self.assertEqual(config.mysqldump_options, [])
+        self.assertEqual(config.mysqldump_bin, "/usr/bin/mysqldump")
+        self.assertEqual(config.mysql_bin, "/usr/bin/mysql")
+        self.assertEqual(config.mysqldump_options, ())
         self.assertEqual(config.log_level, "info")
 
+    def test_compressor_bin_default_without_pigz(self):
+        """Test that the built-in gzip is used if pigz is not installed."""
+        self.mock_which.side_effect = lambda executable: None if executable == "pigz" else fake_which(executable)
+        config = get_config(self.minimal_config_path)
+        self.assertEqual(config.compressor_bin, "")
+        self.mock_which.assert_any_call("pigz")
+
+    def test_compressor_bin_default_with_pigz(self):
+        """Test that pigz is used if found in PATH."""
+        config = get_config(self.minimal_config_path)
+        self.assertEqual(config.compressor_bin, "/usr/bin/pigz")
+
+    def test_missing_executable(self):
+        """Test that a configured executable which can't be found is rejected."""
+        self.mock_which.side_effect = lambda executable: None if executable == "mysqldump" else fake_which(executable)
+        with self.assertRaises(ValueError) as context:
+            get_config(self.minimal_config_path)
+        self.assertIn("Executable for 'mysqldump_bin' not found: mysqldump", str(context.exception))
+
+    def test_config_is_cached(self):
+        """Test that an unchanged configuration file is parsed only once."""
+        config1 = get_config(self.valid_config_path)
+        config2 = get_config(self.valid_config_path)
+        self.assertIs(config1, config2)
+
+    def test_config_cache_invalidated_on_change(self):
+        """Test that a modified configuration file is parsed again."""
+        config_path = os.path.join(self.test_dir, "modified_config.toml")
+        shutil.copy(self.minimal_config_path, config_path)
+        config1 = get_config(config_path)
+        with open(config_path, "a") as f:
+            f.write("versions = 5\n")
+        config2 = get_config(config_path)
+        self.assertIsNot(config1, config2)
+        self.assertEqual(config2.versions, 5)
+
+    def test_config_is_frozen(self):
+        """Test that cached configurations cannot be modified."""
+        config = get_config(self.minimal_config_path)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.versions = 10
+
     def test_file_not_found(self):
         """Test behavior when config file doesn't exist."""
         with self.assertRaises(FileNotFoundError):
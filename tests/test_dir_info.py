@@ -3,12 +3,9 @@ from unittest.mock import patch, MagicMock
 import os
 import shutil
 import tempfile
-import time
-import datetime
-import subprocess
 
 # Import the module and classes/functions to test
-from dir_info import DirInfo, get_dir_info, get_dir_size, get_dir_last_change
+from dir_info import DirInfo, get_dir_info, get_dir_size, get_dir_fingerprint
 
 
 class TestDirInfoFunctions(unittest.TestCase):
@@ -16,23 +13,17 @@ class TestDirInfoFunctions(unittest.TestCase):
     def setUp(self):
         """Set up a temporary directory for filesystem tests."""
         self.test_dir = tempfile.mkdtemp()
-        # Create some structure for get_dir_last_change tests
+        # Create some structure for the tests
         self.file1_path = os.path.join(self.test_dir, "file1.txt")
         self.subdir_path = os.path.join(self.test_dir, "subdir")
         self.file2_path = os.path.join(self.subdir_path, "file2.txt")
 
         os.makedirs(self.subdir_path)
 
-        # Create files with slightly different timestamps
         with open(self.file1_path, 'w') as f:
             f.write("content1")
-        time.sleep(0.01)  # Ensure different timestamps
-        self.time_file1 = os.path.getmtime(self.file1_path)
-
         with open(self.file2_path, 'w') as f:
             f.write("content2")
-        time.sleep(0.01)  # Ensure different timestamps
-        self.time_file2 = os.path.getmtime(self.file2_path)
 
     def tearDown(self):
         """Clean up the temporary directory."""
@@ -40,79 +31,50 @@ class TestDirInfoFunctions(unittest.TestCase):
 
     # --- Tests for get_dir_size ---
 
-    @patch('subprocess.run')
-    def test_get_dir_size_success(self, mock_run):
-        """Test get_dir_size with successful subprocess call."""
-        mock_process = MagicMock()
-        mock_process.stdout = "12345\t/fake/dir\n"
-        mock_process.stderr = ""
-        mock_process.returncode = 0
-        mock_run.return_value = mock_process
-
-        size = get_dir_size("/fake/dir")
-
-        self.assertEqual(size, 12345 * 1024)  # Mock returns bytes,
-        mock_run.assert_called_once_with(
-            ['du', '-sk', '/fake/dir'],
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8'
-        )
+    def test_get_dir_size_success(self):
+        """Test get_dir_size sums up the allocated size of all files and directories."""
+        with open(self.file1_path, 'wb') as f:
+            f.write(b"x" * 100000)
 
-    @patch('subprocess.run')
-    def test_get_dir_size_empty_output(self, mock_run):
-        """Test get_dir_size when 'du' returns empty output."""
-        mock_process = MagicMock()
-        mock_process.stdout = ""  # Empty output
-        mock_process.stderr = ""
-        mock_process.returncode = 0
-        mock_run.return_value = mock_process
-
-        with self.assertRaisesRegex(ValueError, "'du -sk /fake/dir' produced empty output."):
-            get_dir_size("/fake/dir")
-
-    @patch('subprocess.run')
-    def test_get_dir_size_subprocess_error(self, mock_run):
-        """Test get_dir_size when subprocess raises CalledProcessError."""
-        mock_run.side_effect = subprocess.CalledProcessError(
-            cmd=['du', '-sk', '/fake/dir'],
-            returncode=1,
-            stderr="du: cannot access '/fake/dir': No such file or directory"
-        )
+        size = get_dir_size(self.test_dir)
 
-        with self.assertRaises(subprocess.CalledProcessError):
-            get_dir_size("/fake/dir")
-
-    # --- Tests for get_dir_last_change ---
-
-    def test_get_dir_last_change_success(self):
-        """Test get_dir_last_change finds the most recent file."""
-        # file2 should be the most recent
-        expected_dt = datetime.datetime.fromtimestamp(self.time_file2)
-        actual_dt = get_dir_last_change(self.test_dir)
-        # Compare timestamps with a small tolerance for precision issues
-        self.assertAlmostEqual(actual_dt, expected_dt, delta=datetime.timedelta(seconds=0.1))
-
-    def test_get_dir_last_change_not_found(self):
-        """Test get_dir_last_change with a non-existent directory."""
-        non_existent_path = os.path.join(self.test_dir, "not_a_real_dir")
-        with self.assertRaisesRegex(FileNotFoundError, f"Directory does not exist: {non_existent_path}"):
-            get_dir_last_change(non_existent_path)
-
-    def test_get_dir_last_change_empty_dir(self):
-        """Test get_dir_last_change with an empty directory."""
-        empty_dir = os.path.join(self.test_dir, "empty")
-        os.makedirs(empty_dir)
-        last_change = get_dir_last_change(empty_dir)
-        self.assertEqual(last_change, datetime.datetime(1900, 1, 1, 0, 0, 0))
-
-    def test_get_dir_last_change_dir_with_only_subdir(self):
-        """Test get_dir_last_change with a directory containing only an empty subdirectory."""
-        dir_only_subdir = os.path.join(self.test_dir, "only_subdir")
-        os.makedirs(os.path.join(dir_only_subdir, "sub"))
-        last_change = get_dir_last_change(dir_only_subdir)
-        self.assertEqual(last_change, datetime.datetime(1900, 1, 1, 0, 0, 0))
+        expected = sum(
+            os.lstat(p).st_blocks * 512
+            for p in [self.test_dir, self.file1_path, self.subdir_path, self.file2_path]
+        )
+        self.assertEqual(size, expected)
+        self.assertGreaterEqual(size, 100000)
+
+    def test_get_dir_size_hard_links_counted_once(self):
+        """Test get_dir_size counts files with multiple hard links only once."""
+        size_before = get_dir_size(self.test_dir)
+        os.link(self.file1_path, os.path.join(self.subdir_path, "file1_link.txt"))
+
+        self.assertEqual(get_dir_size(self.test_dir), size_before)
+
+    def test_get_dir_size_not_found(self):
+        """Test get_dir_size with a non-existent directory."""
+        with self.assertRaises(FileNotFoundError):
+            get_dir_size(os.path.join(self.test_dir, "not_a_real_dir"))
+
+    # --- Tests for get_dir_fingerprint ---
+
+    def test_get_dir_fingerprint(self):
+        """Test get_dir_fingerprint returns the latest mtime and the total size of all files."""
+        fingerprint = get_dir_fingerprint(self.test_dir)
+        expected_mtime_ns = max(os.stat(self.file1_path).st_mtime_ns, os.stat(self.file2_path).st_mtime_ns)
+        self.assertEqual(fingerprint, (expected_mtime_ns, len("content1") + len("content2")))
+
+    def test_get_dir_fingerprint_file_removed(self):
+        """Test that removing an older file changes the fingerprint."""
+        fingerprint = get_dir_fingerprint(self.test_dir)
+        os.remove(self.file1_path)
+        self.assertNotEqual(get_dir_fingerprint(self.test_dir), fingerprint)
+
+    def test_get_dir_fingerprint_not_found(self):
+        """Test get_dir_fingerprint raises FileNotFoundError for a non-existent directory."""
+        with self.assertRaises(FileNotFoundError):
+            get_dir_fingerprint(os.path.join(self.test_dir, "non_existent_dir"))
 
     # --- Tests for get_dir_info ---
 
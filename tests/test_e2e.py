@@ -1,65 +1,77 @@
+import glob
+import gzip
+import re
+import shutil
 import socket
 import time
 import unittest
 import subprocess
+import sys
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class TestEndToEnd(unittest.TestCase):
+    # Print the full log of each backup only if asked for
+    _verbose = '-v' in sys.argv or bool(os.environ.get('OMA_VERBOSE'))
+    _ERR_RE = re.compile(r'^.*Error.*$', re.MULTILINE)
 
     @classmethod
     def setUpClass(self):
-        # Build the app
-        subprocess.run(".github/scripts/build.sh")
+        # Build the app, unless the binary is newer than all sources
+        if os.environ.get('OMA_SKIP_BUILD') != '1' and not is_build_current('./oma'):
+            subprocess.run(".github/scripts/build.sh", check=True)
         self.databases = ['demo1', 'd-e-m-o-2', 'skip1']
+        self.active_databases = tuple(db for db in self.databases if not db.startswith('skip'))
         self.backup_dir = "/tmp/oma"
         # Prepare the backup dir
-        subprocess.run(f"rm -rf {self.backup_dir} || true", shell=True)
-        os.mkdir(self.backup_dir)
-        # Prepare the databases
-        for database in self.databases:
-            print(f"Creating database {database} ...")
-            subprocess.run(f"mysql -e 'DROP DATABASE IF EXISTS `{database}`; CREATE DATABASE `{database}`'",
-                           shell=True, check=True)
-            print(f"Filling database {database} with demo data ...")
-            subprocess.run(f"mysql {database}< ./test_data/world.sql", shell=True, check=True)
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+        os.makedirs(self.backup_dir, exist_ok=True)
+        # Prepare the databases, reading the demo data only once
+        with open('./test_data/world.sql', 'rb') as f:
+            sql_blob = f.read()
+        print(f"Creating databases {', '.join(self.databases)} ...")
+        run_mysql_script(''.join(
+            f"DROP DATABASE IF EXISTS `{database}`; CREATE DATABASE `{database}`;" for database in self.databases
+        ))
+        with ThreadPoolExecutor(max_workers=len(self.databases)) as executor:
+            futures = [executor.submit(fill_database, database, sql_blob) for database in self.databases]
+            for future in as_completed(futures):
+                # Re-raise any error of the database creation
+                future.result()
         # Wait for all mysql background write processes to be completed
-        time.sleep(4)
+        self._wait_mysql_quiet()
 
     @classmethod
     def tearDownClass(self):
         # Remove the created database
-        for database in self.databases:
-            subprocess.run(f"mysql -e 'DROP DATABASE `{database}`'", shell=True, check=True)
+        run_mysql_script(''.join(f"DROP DATABASE `{database}`;" for database in self.databases))
 
     def setUp(self):
-        pass
+        self._log_cache = {}
 
     def tearDown(self):
         pass
 
     def test_01_full_backup(self):
-        time.sleep(3)
+        self._wait_mysql_quiet()
         self.__run_backup()
 
         log_content = self.__read_log()
 
         # Assert no errors found in the log
-        self.assertNotIn("Error", log_content, "Errors found in the log file")
+        self._assert_no_error(log_content)
         # Validate backup parallelism
         self.assertIn("INFO Will start 2 parallel mysqldump processes", log_content, "parallelism does not match")
 
         # Assert all databases have been backed up and not re-used
-        for database in [db for db in self.databases if not db.startswith("skip")]:
-            self.assertIn(
-                f"INFO DB '{database}': Backup successfully",
-                log_content,
-                "Success message not found in the log file"
-            )
+        self._assert_all_in([f"INFO DB '{database}': Backup successfully" for database in self.active_databases],
+                            log_content)
+        for database in self.active_databases:
             # Validate mysqldump options have been applied
-            self.assertIn(
-                f"Executing command: bash -c 'mysqldump {database} --single-transaction --quick",
+            self.assertRegex(
                 log_content,
+                rf"Executing command: \S*mysqldump {re.escape(database)} --single-transaction --quick",
                 "mysqldump options not applied"
             )
 
@@ -68,36 +80,33 @@ class TestEndToEnd(unittest.TestCase):
         Run the backup again. Because no table has changed, all databases are marked as re-used.
         :return:
         """
-        time.sleep(3)
+        self._wait_mysql_quiet()
         self.__run_backup()
         log_content = self.__read_log()
 
         # Assert no errors found in the log
-        self.assertNotIn("Error", log_content, "Errors found in the log file")
+        self._assert_no_error(log_content)
         # Validate backup parallelism
         self.assertIn("INFO Will start 2 parallel mysqldump processes", log_content, "parallelism does not match")
 
-        for database in [db for db in self.databases if not db.startswith("skip")]:
-            self.assertIn(
-                f"INFO DB '{database}': Backup is newer than last database change. Reusing previous backup",
-                log_content,
-                "Previous backup reused."
-            )
+        self._assert_all_in([
+            f"INFO DB '{database}': Backup is newer than last database change. Reusing previous backup"
+            for database in self.active_databases
+        ], log_content)
 
     def test_03_partial_changes(self):
         """
         Update a single database. Expect only this database to be backed up. The rest must be skipped.
         :return:
         """
-        subprocess.run(r'mysql demo1 -e "update city set Population=FLOOR(RAND()*1000) where ID=1"',
-                       shell=True,
+        subprocess.run(['mysql', 'demo1', '-e', 'update city set Population=FLOOR(RAND()*1000) where ID=1'],
                        check=True)
         # Wait for all mysql background write processes to be completed
-        time.sleep(4)
+        self._wait_mysql_quiet()
         self.__run_backup()
         log_content = self.__read_log()
         # Assert no errors found in the log
-        self.assertNotIn("Error", log_content, "Errors found in the log file")
+        self._assert_no_error(log_content)
 
         self.assertIn(
             "INFO DB 'd-e-m-o-2': Backup is newer than last database change. Reusing previous backup",
@@ -119,27 +128,38 @@ class TestEndToEnd(unittest.TestCase):
         log_content = self.__read_log()
 
         # Assert no errors found in the log
-        self.assertNotIn("Error", log_content, "Errors found in the log file")
+        self._assert_no_error(log_content)
 
-        for database in [db for db in self.databases if not db.startswith("skip")]:
-            self.assertIn(
-                f"INFO DB '{database}': Backup is newer than last database change. Reusing previous backup",
-                log_content,
-                "Previous backup reused."
-            )
+        self._assert_all_in([
+            f"INFO DB '{database}': Backup is newer than last database change. Reusing previous backup"
+            for database in self.active_databases
+        ], log_content)
         # Because we want to store only 3 version, check we have 3 (and not 4) versions
         self.assertEqual(count_subfolders('/tmp/oma'), 3, 'Number of subfolders should equal 3.')
 
     def test_05_restore_from_backup(self):
-        for database in [db for db in self.databases if not db.startswith("skip")]:
-            subprocess.run(f"mysql -e 'DROP DATABASE `{database}`'", shell=True, check=True)
-            subprocess.run(f"mysql -e 'CREATE DATABASE `{database}`'", shell=True, check=True)
-            subprocess.run(f"zcat /tmp/oma/last/{database}.sql.gz | mysql {database}", shell=True, check=True)
-            response = subprocess.run(
-                f"mysql {database} -N -e 'show tables'|wc -l",
-                shell=True, check=True, text=True, capture_output=True
-            )
-            self.assertEqual(int(response.stdout.strip()), 3)
+        run_mysql_script(''.join(
+            f"DROP DATABASE `{database}`; CREATE DATABASE `{database}`;" for database in self.active_databases
+        ))
+        for database in self.active_databases:
+            # Decompress in-process and stream the dump into the mysql client.
+            # GzipFile buffers its reads itself, so the file is opened unbuffered.
+            with open(f'/tmp/oma/last/{database}.sql.gz', 'rb', buffering=0) as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='rb') as src:
+                process = subprocess.Popen(['mysql', database], stdin=subprocess.PIPE, bufsize=128 * 1024)
+                shutil.copyfileobj(src, process.stdin, length=1 << 20)
+                process.stdin.close()
+                self.assertEqual(process.wait(), 0, f"Restoring {database} failed")
+        # Count the restored tables of all databases with a single query
+        schemas = ', '.join(f"'{database}'" for database in self.active_databases)
+        response = subprocess.run(
+            ['mysql', '-N', '-e', 'SELECT table_schema, COUNT(*) FROM information_schema.tables'
+                                  f' WHERE table_schema IN ({schemas}) GROUP BY table_schema'],
+            check=True, text=True, capture_output=True
+        )
+        tables = dict(line.split('\t') for line in response.stdout.splitlines())
+        for database in self.active_databases:
+            self.assertEqual(int(tables.get(database, 0)), 3)
 
     def test_06_full_backup_no_skip(self):
         self.__run_backup("run2")
@@ -147,19 +167,16 @@ class TestEndToEnd(unittest.TestCase):
         log_content = self.__read_log()
 
         # Assert no errors found in the log
-        self.assertNotIn("Error", log_content, "Errors found in the log file")
+        self._assert_no_error(log_content)
 
         # Assert all databases have been backed up and not re-used
-        for database in [db for db in self.databases if not db.startswith("skip")]:
-            self.assertIn(
-                f"INFO DB '{database}': Backup successfully",
-                log_content,
-                "Success message not found in the log file"
-            )
+        self._assert_all_in([f"INFO DB '{database}': Backup successfully" for database in self.active_databases],
+                            log_content)
+        for database in self.active_databases:
             # Validate mysqldump options have been applied
-            self.assertIn(
-                f"Executing command: bash -c 'mysqldump {database} --single-transaction --quick",
+            self.assertRegex(
                 log_content,
+                rf"Executing command: \S*mysqldump {re.escape(database)} --single-transaction --quick",
                 "mysqldump options not applied"
             )
             self.assertNotIn(
@@ -192,8 +209,7 @@ class TestEndToEnd(unittest.TestCase):
             'ERROR Backup aborted due to failed run conditions',
         ]
         # Assert messages are found
-        for msg in msgs:
-            self.assertIn(msg, log_content, f"{msg}: not found in the log file")
+        self._assert_all_in(msgs, log_content)
 
     def test_09_timeout_skip(self):
         self.__run_backup("skip_condition_timeout", 1)
@@ -207,8 +223,7 @@ class TestEndToEnd(unittest.TestCase):
             'ERROR Backup aborted due to failed run conditions',
         ]
         # Assert messages are found
-        for msg in msgs:
-            self.assertIn(msg, log_content, f"{msg}: not found in the log file")
+        self._assert_all_in(msgs, log_content)
 
     def test_10_terminate_condition(self):
         self.__run_backup("terminate_condition_success", 0)
@@ -220,8 +235,7 @@ class TestEndToEnd(unittest.TestCase):
             'INFO All terminate conditions succeeded',
         ]
         # Assert messages are found
-        for msg in msgs:
-            self.assertIn(msg, log_content, f"{msg}: not found in the log file")
+        self._assert_all_in(msgs, log_content)
 
     def test_11_delete_before(self):
         self.__run_backup("delete_before", 0)
@@ -233,8 +247,7 @@ class TestEndToEnd(unittest.TestCase):
             'Backup is newer than last database change. Reusing previous backup'
         ]
         # Assert backup has been skipped
-        for msg in msgs:
-            self.assertIn(msg, log_content, f"{msg}: not found in the log file")
+        self._assert_all_in(msgs, log_content)
 
     def test_12_double_run(self):
         """
@@ -247,21 +260,20 @@ class TestEndToEnd(unittest.TestCase):
         try:
             # Start first instance in background
             proc1 = subprocess.Popen(
-                "./oma -c test_data/sleep_for_double_run.conf",
-                shell=True,
+                ["./oma", "-c", "test_data/sleep_for_double_run.conf"],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
 
-            # Give first instance more time to acquire the lock (but not complete)
-            time.sleep(1)
-
+            # Wait for the first instance to acquire the lock (but not complete)
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline and not is_port_in_use():
+                time.sleep(0.01)
             self.assertTrue(is_port_in_use(), "TCP Lock Port not open.")
 
             # Try to start second instance while first is still running
             proc2 = subprocess.Popen(
-                "./oma -c test_data/run1.conf",
-                shell=True,
+                ["./oma", "-c", "test_data/run1.conf"],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
@@ -307,29 +319,79 @@ class TestEndToEnd(unittest.TestCase):
                     proc2.kill()
                     proc2.wait()
 
+    def _assert_no_error(self, log_content):
+        """
+        Assert the log contains no error, reporting the first offending line.
+        :param log_content: Log content
+        :return:
+        """
+        match = self._ERR_RE.search(log_content)
+        self.assertIsNone(match, f"Errors found in the log file: {match.group() if match else ''}")
+
+    def _assert_all_in(self, needles, haystack):
+        """
+        Assert all messages are found in the log, scanning the log only once.
+        :param needles: Messages to find
+        :param haystack: Log content
+        :return:
+        """
+        # Longest first, so a message is not hidden by a shorter one it starts with
+        pattern = re.compile('|'.join(map(re.escape, sorted(needles, key=len, reverse=True))))
+        found = set(match.group() for match in pattern.finditer(haystack))
+        for needle in needles:
+            # Matches don't overlap, so double-check a message not found by the scan
+            if needle not in found:
+                self.assertIn(needle, haystack, f"{needle}: not found in the log file")
+
+    @staticmethod
+    def _wait_mysql_quiet(timeout: float = 10):
+        """
+        Wait until MySQL runs no statement and has written all dirty pages to the data files,
+        so the file modification times of the databases no longer change. Gives up after the timeout.
+        :param timeout: Seconds to wait at most
+        :return:
+        """
+        query = ("SELECT (SELECT COUNT(*) FROM information_schema.processlist"
+                 " WHERE COMMAND NOT IN ('Sleep', 'Daemon') AND ID != CONNECTION_ID())"
+                 " + (SELECT VARIABLE_VALUE FROM performance_schema.global_status"
+                 " WHERE VARIABLE_NAME = 'Innodb_buffer_pool_pages_dirty')")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            response = subprocess.run(['mysql', '-N', '-e', query], check=True, text=True, capture_output=True)
+            if int(float(response.stdout.strip())) == 0:
+                return
+            time.sleep(0.1)
+
     def __run_backup(self, config: str = "run1", expected_exit_code: int = 0):
         response = subprocess.run(
-            f"./oma -c test_data/{config}.conf",
-            shell=True,
+            ["./oma", "-c", f"test_data/{config}.conf"],
             check=False,
             capture_output=True
         )
-        time.sleep(3)
+        # Show the output of oma only if it is needed for diagnostics
+        if response.returncode != expected_exit_code or self._verbose:
+            sys.stdout.write(response.stdout.decode('utf-8', 'replace'))
+            sys.stderr.write(response.stderr.decode('utf-8', 'replace'))
         self.assertEqual(response.returncode, expected_exit_code)
-        print(response.stdout.decode())
-        print(response.stderr.decode())
         self.__read_zabbix_sender_log()
 
     def __read_log(self) -> str:
         # Open and read the log file
         log_file = '/tmp/oma/last.log'
-        print("Reading log file: " + log_file)
-        with open(log_file, "r") as f:
-            log_content = f.read()
-
-        print("=" * 120)
-        print(log_content)
-        print("=" * 120)
+        # Don't read the log again as long as it is unchanged
+        st = os.stat(log_file)
+        key = (st.st_mtime_ns, st.st_size)
+        if self._log_cache.get('key') == key:
+            return self._log_cache['content']
+        with open(log_file, 'rb', buffering=1 << 20) as f:
+            log_content = f.read().decode('utf-8', 'replace')
+        self._log_cache = {'key': key, 'content': log_content}
+
+        if self._verbose:
+            print("Reading log file: " + log_file)
+            print("=" * 120)
+            print(log_content)
+            print("=" * 120)
 
         return log_content
 
@@ -340,6 +402,28 @@ class TestEndToEnd(unittest.TestCase):
         self.assertIn("Summary", log_content, f"Summary not found in {log_file}")
 
 
+def run_mysql_script(script):
+    """
+    Run all statements of a SQL script through a single mysql client connection.
+
+    Args:
+        script (str): SQL statements separated by semicolons
+    """
+    subprocess.run(['mysql'], input=script.encode(), check=True)
+
+
+def fill_database(database, sql_blob):
+    """
+    Fill a database with demo data.
+
+    Args:
+        database (str): Name of the database
+        sql_blob (bytes): SQL statements to load into the database
+    """
+    print(f"Filling database {database} with demo data ...")
+    subprocess.run(['mysql', database], input=sql_blob, check=True)
+
+
 def count_subfolders(directory_path):
     """
     Count the number of real subfolders in the specified directory,
@@ -355,31 +439,32 @@ def count_subfolders(directory_path):
     if not os.path.isdir(directory_path):
         raise ValueError(f"The path {directory_path} is not a valid directory")
 
-    # Get all items in the directory
-    items = os.listdir(directory_path)
-
     # Count only real directories (not symbolic links)
-    real_subfolders = 0
-    for item in items:
-        full_path = os.path.join(directory_path, item)
-        # Check if it's a directory AND not a symbolic link
-        if os.path.isdir(full_path) and not os.path.islink(full_path):
-            real_subfolders += 1
+    with os.scandir(directory_path) as entries:
+        return sum(1 for entry in entries if entry.is_dir(follow_symlinks=False))
+
 
-    return real_subfolders
+def is_build_current(binary_path):
+    """
+    Check if the built binary is newer than every Python source it is zipped from.
+
+    Args:
+        binary_path (str): Path to the built binary
+
+    Returns:
+        bool: True if the binary exists and no source changed after it was built
+    """
+    if not os.path.isfile(binary_path):
+        return False
+    sources = glob.glob('*.py')
+    return not sources or os.path.getmtime(binary_path) > max(os.path.getmtime(p) for p in sources)
 
 
 def is_port_in_use(host='127.0.0.1', port=45678):
-    """Check if a port is in use (cannot be bound)"""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.bind((host, port))
-            # If we can bind, port is free
-            return False
-    except OSError:
-        # If we cannot bind, port is in use
-        return True
+    """Check if a port is in use (accepts connections)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.1)
+        return sock.connect_ex((host, port)) == 0
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 import unittest
 import logging
+import logging.handlers
 import os
 import tempfile
 import shutil
-from logger import new_logger
+from logger import new_logger, OmaLogger
 
 
 class TestLogger(unittest.TestCase):
@@ -22,6 +23,11 @@ class TestLogger(unittest.TestCase):
 
     def tearDown(self):
         """Clean up after each test."""
+        # Stop writing to the log files before removing them
+        logger = logging.getLogger('oma')
+        if isinstance(logger, OmaLogger):
+            logger.stop_listener()
+
         # Remove the temporary directory and all its contents
         shutil.rmtree(self.test_dir)
 
@@ -53,11 +59,12 @@ class TestLogger(unittest.TestCase):
         # Check default log level (info)
         self.assertEqual(logger.level, logging.INFO)
 
-        # Check that there is exactly one handlers
+        # Check that there is exactly one handler that queues the records
         self.assertEqual(len(logger.handlers), 1)
+        self.assertIsInstance(logger.handlers[0], logging.handlers.QueueHandler)
 
-        # Check that one handler is a FileHandler
-        file_handlers = [h for h in logger.handlers if isinstance(h, logging.FileHandler)]
+        # Check that the listener writes the queued records with one FileHandler
+        file_handlers = [h for h in logger.listener.handlers if isinstance(h, logging.FileHandler)]
         self.assertEqual(len(file_handlers), 1)
 
         # Check that the file handler has the correct path
@@ -66,6 +73,7 @@ class TestLogger(unittest.TestCase):
         # Test logging to file
         test_message = "Test log message"
         logger.info(test_message)
+        logger.flush()
 
         # Check that the message was written to the file
         with open(log_file, 'r') as f:
@@ -123,6 +131,7 @@ class TestLogger(unittest.TestCase):
         # Create logger and log a message
         logger = new_logger(log_file=log_file)
         logger.info("New log message")
+        logger.flush()
 
         # Check that the file was overwritten (not appended)
         with open(log_file, 'r') as f:
@@ -131,6 +140,53 @@ class TestLogger(unittest.TestCase):
         self.assertNotIn("Existing content", log_content)
         self.assertIn("New log message", log_content)
 
+    def test_logger_buffers_records(self):
+        """Test that records are written to the file on flush, or immediately on errors."""
+        log_file = os.path.join(self.test_dir, "test.log")
+        logger = new_logger(log_file=log_file)
+        logger.info("Buffered message")
+
+        # Errors force the buffered records to be written
+        logger.error("Error message")
+        logger.listener.stop()
+        with open(log_file, 'r') as f:
+            log_content = f.read()
+        self.assertIn("Buffered message", log_content)
+        self.assertIn("Error message", log_content)
+        logger.listener.start()
+
+    def test_read_log_flushes(self):
+        """Test that read_log returns records that are still buffered."""
+        log_file = os.path.join(self.test_dir, "test.log")
+        logger = new_logger(log_file=log_file)
+        logger.info("Buffered message")
+
+        self.assertIn("Buffered message", logger.read_log())
+
+    def test_read_log_size(self):
+        """Test that read_log returns at most size characters from the start of the log."""
+        log_file = os.path.join(self.test_dir, "test.log")
+        logger = new_logger(log_file=log_file)
+        logger.info("First message")
+        logger.info("Second message")
+
+        full_content = logger.read_log()
+        first_line_size = full_content.index("\n") + 1
+        self.assertEqual(logger.read_log(first_line_size + 5), full_content[:first_line_size])
+        self.assertEqual(logger.read_log(len(full_content.encode()) + 1), full_content)
+
+    def test_read_log_size_multibyte(self):
+        """Test that read_log doesn't return a multibyte character cut off by the size limit."""
+        log_file = os.path.join(self.test_dir, "test.log")
+        logger = new_logger(log_file=log_file)
+        logger.info("Größe")
+
+        full_content = logger.read_log()
+        content = logger.read_log(len(full_content.encode()) - 3)
+        self.assertNotIn("Gr", content)
+        self.assertNotIn("\ufffd", content)
+        self.assertTrue(full_content.startswith(content))
+
     def test_multiple_loggers_same_name(self):
         """Test creating multiple loggers with the same name."""
         # Create first logger
@@ -152,6 +208,7 @@ class TestLogger(unittest.TestCase):
 
         # Log a test message
         logger.info("Test formatter")
+        logger.flush()
 
         # Check the format in the log file
         with open(log_file, 'r') as f:
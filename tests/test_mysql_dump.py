@@ -1,5 +1,13 @@
+import copy
+import gzip
+import importlib
+import io
+import shutil
+import subprocess
+import tempfile
+import types
 import unittest
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, MagicMock, ANY
 import os
 from datetime import datetime, timedelta
 
@@ -8,27 +16,93 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from mysql_dump import MySQLDump  # noqa: E402
-from config import Config  # noqa: E402
+import mysql_dump  # noqa: E402
+from mysql_dump import MySQLDump, keep_tail, DUMP_TAIL_SIZE, DUMP_STDERR_SIZE  # noqa: E402
 from store_manager import StoreManager  # noqa: E402
+from dir_info import get_dir_info  # noqa: E402
+
+
+class TestKeepTail(unittest.TestCase):
+    def test_short_chunks(self):
+        """Test that short chunks are appended to the tail."""
+        self.assertEqual(keep_tail(b"abc", b"def"), b"abcdef")
+
+    def test_large_chunk(self):
+        """Test that the tail is limited to DUMP_TAIL_SIZE bytes."""
+        chunk = b"x" * DUMP_TAIL_SIZE * 2 + b"end"
+        tail = keep_tail(b"start", chunk)
+        self.assertEqual(len(tail), DUMP_TAIL_SIZE)
+        self.assertTrue(tail.endswith(b"xend"))
+
+    def test_size(self):
+        """Test that the tail is limited to the given size."""
+        self.assertEqual(keep_tail(b"abc", b"def", 4), b"cdef")
+
+
+class TestGzipLib(unittest.TestCase):
+    def tearDown(self):
+        # Restore the module as imported with the installed packages
+        importlib.reload(mysql_dump)
+
+    def _compress(self, data: bytes) -> bytes:
+        """Compress data with MySQLDump._compress_gzip and return the written file content."""
+        out = io.BytesIO()
+        mysql_dump.MySQLDump._compress_gzip(io.BytesIO(data), out)
+        return out.getvalue()
+
+    def test_without_isal(self):
+        """Test that the gzip module is used if isal is not installed."""
+        with patch.dict(sys.modules, {'isal': None}):
+            importlib.reload(mysql_dump)
+        self.assertIs(mysql_dump.gzip_lib, gzip)
+        self.assertEqual(mysql_dump.GZIP_COMPRESS_LEVEL, 6)
+        data = b"INSERT INTO t VALUES (1);\n" * 1000
+        self.assertEqual(gzip.decompress(self._compress(data)), data)
+
+    def test_with_isal(self):
+        """Test that igzip is used if isal is installed and the dump can be decompressed with gzip."""
+        try:
+            from isal import igzip
+        except ModuleNotFoundError:
+            # Stand in for isal with the same interface
+            igzip = gzip
+        fake_isal = types.ModuleType('isal')
+        fake_isal.igzip = igzip
+        with patch.dict(sys.modules, {'isal': fake_isal, 'isal.igzip': igzip}):
+            importlib.reload(mysql_dump)
+        self.assertIs(mysql_dump.gzip_lib, igzip)
+        self.assertEqual(mysql_dump.GZIP_COMPRESS_LEVEL, 2)
+        data = b"INSERT INTO t VALUES (1);\n" * 1000
+        self.assertEqual(gzip.decompress(self._compress(data)), data)
 
 
 class TestMySQLDump(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Build the config fake once, tests get a shallow copy to change their settings on.
+        # A plain namespace is enough, nothing asserts calls on the config.
+        cls._proto_config = types.SimpleNamespace(
+            mysql_bin="/usr/bin/mysql",
+            mysqldump_bin="mysqldump",
+            compressor_bin="",
+            exclude_databases=["information_schema", "performance_schema"],
+            parallelism=2,
+            skip_unchanged_dbs=True,
+            mysqldump_options=("--single-transaction", "--quick"),
+            link_type="hard",
+            do_databases=None,
+        )
+
     def setUp(self):
         # Create mocks for dependencies
-        self.mock_config = MagicMock(spec=Config)
-        self.mock_config.mysql_bin = "/usr/bin/mysql"
-        self.mock_config.exclude_databases = ["information_schema", "performance_schema"]
-        self.mock_config.parallelism = 2
-        self.mock_config.skip_unchanged_dbs = True
-        self.mock_config.mysqldump_options = ["--single-transaction", "--quick"]
-        self.mock_config.link_type = "hard"
-        self.mock_config.do_databases = None  # Add this attribute
+        self.mock_config = copy.copy(self._proto_config)
 
         self.mock_store_manager = MagicMock(spec=StoreManager)
         self.mock_store_manager.current_dir = MagicMock()  # Create the attribute first
-        self.mock_store_manager.current_dir.path = "/tmp/backup"
+        self.backup_dir = tempfile.mkdtemp()
+        self.mock_store_manager.current_dir.path = self.backup_dir
         self.mock_store_manager.current_dir.bytes_free = 1000000000  # 1GB free
+        self.mock_store_manager.get_database_fingerprint.return_value = None
 
         self.mock_logger = MagicMock()
 
@@ -36,7 +110,6 @@ class TestMySQLDump(unittest.TestCase):
         mock_mysql_info = MagicMock()
         mock_mysql_info.data_dir = MagicMock()
         mock_mysql_info.data_dir.bytes_used = 500000000
-        mock_mysql_info.get_databases_size = MagicMock(return_value=500000000)
         mock_mysql_info.databases = []  # Add this attribute
 
         # Patch MySQLInfo before creating MySQLDump instance
@@ -48,12 +121,77 @@ class TestMySQLDump(unittest.TestCase):
                 logger=self.mock_logger
             )
 
+    def tearDown(self):
+        shutil.rmtree(self.backup_dir)
+
     def test_init(self):
         """Test initialization of MySQLDump."""
         self.assertEqual(self.mysql_dump.config, self.mock_config)
         self.assertEqual(self.mysql_dump.store_manager, self.mock_store_manager)
         self.assertEqual(self.mysql_dump.logger, self.mock_logger)
 
+    def test_execute_largest_databases_first(self):
+        """Test that execute dumps the largest databases first."""
+        self.mock_config.parallelism = 1
+        self.mock_config.skip_unchanged_dbs = False
+        self.mock_config.exclude_databases = []
+        self.mysql_dump.mysql_info.databases = ["small", "big", "medium"]
+        self.mysql_dump.mysql_info.get_databases_sizes.return_value = {"small": 1, "big": 100, "medium": 10}
+        self.mock_store_manager.get_backup_info.return_value.compression_ratio = 0.5
+
+        with patch.object(self.mysql_dump, '_mysqldump_to_gzip', return_value="ok") as mock_dump:
+            result = self.mysql_dump.execute()
+
+        self.assertEqual([c[0][0] for c in mock_dump.call_args_list], ["big", "medium", "small"])
+        self.assertEqual(result.successful, 3)
+
+    def test_execute_looks_at_databases_in_worker(self):
+        """Test that the fingerprint is taken by the worker right before the dump, not when dispatching."""
+        self.mock_config.exclude_databases = []
+        self.mysql_dump.mysql_info.databases = ["db1", "db2"]
+        self.mysql_dump.mysql_info.get_databases_sizes.return_value = {"db1": 1, "db2": 2}
+        self.mock_store_manager.get_backup_info.return_value.compression_ratio = 0.5
+
+        with patch.object(self.mysql_dump, '_mysqldump_to_gzip', return_value="ok") as mock_dump:
+            self.mysql_dump.execute()
+
+        self.assertEqual(sorted(c[0] for c in mock_dump.call_args_list), [("db1",), ("db2",)])
+        self.mysql_dump.mysql_info.get_database_fingerprint.assert_not_called()
+        self.mysql_dump.mysql_info.get_database_last_change.assert_not_called()
+        self.mock_store_manager.get_database_backup_time.assert_not_called()
+
+    @patch('os.cpu_count', return_value=2)
+    def test_execute_parallelism_capped(self, mock_cpu_count):
+        """Test that execute starts no more workers than CPUs and databases are available."""
+        self.mock_config.parallelism = 8
+        self.mock_config.skip_unchanged_dbs = False
+        self.mock_config.exclude_databases = []
+        self.mysql_dump.mysql_info.databases = ["db1", "db2", "db3"]
+        self.mysql_dump.mysql_info.get_databases_sizes.return_value = {"db1": 1, "db2": 1, "db3": 1}
+        self.mock_store_manager.get_backup_info.return_value.compression_ratio = 0.5
+
+        with patch.object(self.mysql_dump, '_mysqldump_to_gzip', return_value="ok"):
+            self.mysql_dump.execute()
+        self.assertEqual(self._logged_parallelism(), 2)
+        self.mock_logger.warning.assert_called_once()
+
+        # A single database needs a single worker
+        self.mock_logger.reset_mock()
+        self.mock_config.parallelism = 2
+        self.mysql_dump.mysql_info.databases = ["db1"]
+        self.mysql_dump.mysql_info.get_databases_sizes.return_value = {"db1": 1}
+        with patch.object(self.mysql_dump, '_mysqldump_to_gzip', return_value="ok"):
+            self.mysql_dump.execute()
+        self.assertEqual(self._logged_parallelism(), 1)
+        self.mock_logger.warning.assert_not_called()
+
+    def _logged_parallelism(self):
+        """Return the number of parallel mysqldump processes logged by execute."""
+        for c in self.mock_logger.info.call_args_list:
+            if c[0][0].startswith("Will start %d parallel"):
+                return c[0][1]
+        self.fail("Number of parallel mysqldump processes not logged")
+
     def test_check_free_space_sufficient(self):
         """Test _check_free_space when there is enough space."""
         # Setup mock for get_backup_info
@@ -62,7 +200,7 @@ class TestMySQLDump(unittest.TestCase):
         self.mock_store_manager.get_backup_info.return_value = mock_backup_info
 
         # Call _check_free_space
-        result = self.mysql_dump._check_free_space([])
+        result = self.mysql_dump._check_free_space({"db1": 300000000, "db2": 200000000})
 
         # Verify result
         self.assertTrue(result)
@@ -83,68 +221,170 @@ class TestMySQLDump(unittest.TestCase):
 
         # Call _check_free_space and expect an exception
         with self.assertRaises(NotEnoughDiskSpaceError) as context:
-            self.mysql_dump._check_free_space([])
+            self.mysql_dump._check_free_space({"db1": 300000000, "db2": 200000000})
 
         # Verify the exception message
         self.assertEqual(str(context.exception), "Not enough free space in target directory.")
 
-    @patch('subprocess.Popen')
-    @patch('tempfile.NamedTemporaryFile')
-    @patch('os.path.exists')
-    @patch('os.remove')
-    def test_mysqldump_to_gzip_success(self, mock_remove, mock_exists, mock_temp_file, mock_popen):
-        """Test _mysqldump_to_gzip with successful execution."""
-        # Setup mocks
-        mock_temp = MagicMock()
-        mock_temp.name = "/tmp/temp_file"
-        mock_temp_file.return_value.__enter__.return_value = mock_temp
-
+    def _mock_mysqldump_process(self, mock_popen, stdout_chunks, stderr=b"", returncode=0):
+        """Let the mocked Popen return a process producing the given stdout chunks."""
         mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.communicate.return_value = (None, b"")
+        mock_process.returncode = returncode
+        mock_process.stdout.read.side_effect = list(stdout_chunks) + [b""]
+        mock_process.stderr.read.side_effect = [stderr, b""]
         mock_popen.return_value.__enter__.return_value = mock_process
+        return mock_process
+
+    def test_mysqldump_to_gzip_chatty_stderr(self):
+        """Test _mysqldump_to_gzip doesn't block if mysqldump writes more to stderr than the pipe can hold."""
+        mysqldump_bin = os.path.join(self.backup_dir, "mysqldump")
+        with open(mysqldump_bin, "w") as f:
+            f.write("#!/bin/sh\n"
+                    "head -c 1000000 /dev/zero | tr '\\0' w >&2\n"
+                    "echo '-- Dump completed on 2023-01-01 12:00:00'\n")
+        os.chmod(mysqldump_bin, 0o755)
+        self.mock_config.mysqldump_bin = mysqldump_bin
+        self.mock_config.skip_unchanged_dbs = False
 
-        mock_exists.return_value = True
+        result = self.mysql_dump._mysqldump_to_gzip("test")
+
+        self.assertEqual(result, os.path.join(self.backup_dir, "test.sql.gz"))
+        self.mock_logger.error.assert_called_once()
+        # Only the end of stderr is kept
+        self.assertEqual(self.mock_logger.error.call_args[0][2], "w" * DUMP_STDERR_SIZE)
+
+    @patch('mysql_dump.drop_file_cache')
+    @patch('mysql_dump.DUMP_DROP_CACHE_SIZE', 10)
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_drops_file_cache(self, mock_popen, mock_drop_file_cache):
+        """Test that the dump file is dropped from the page cache while it is written and when it is complete."""
+        self._mock_mysqldump_process(mock_popen, [
+            b"CREATE TABLE t (id int);\n",
+            b"INSERT INTO t VALUES (1);\n",
+            b"-- Dump completed on 2023-01-01 12:00:00\n",
+        ])
+        self.mock_config.skip_unchanged_dbs = False
+
+        self.mysql_dump._mysqldump_to_gzip("test")
+
+        # Once per chunk exceeding DUMP_DROP_CACHE_SIZE, only the final call for the complete file syncs
+        self.assertEqual(mock_drop_file_cache.call_count, 4)
+        self.assertEqual([c.kwargs.get('sync', False) for c in mock_drop_file_cache.call_args_list],
+                         [False, False, False, True])
+
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_success(self, mock_popen):
+        """Test _mysqldump_to_gzip with successful execution."""
+        self._mock_mysqldump_process(mock_popen, [
+            b"CREATE TABLE t (id int);\n",
+            b"INSERT INTO t VALUES (1);\n-- Dump completed on 2023-01-01 12:00:00\n",
+        ])
 
         # Setup mock for get_database_last_change and get_database_backup_time
         self.mysql_dump.mysql_info.get_database_last_change.return_value = datetime.now() - timedelta(hours=1)
         self.mock_store_manager.get_database_backup_time.return_value = datetime.now() - timedelta(hours=2)
 
-        # Mock open to return completion message
-        with patch('builtins.open', mock_open(read_data="-- Dump completed on 2023-01-01 12:00:00")):
-            # Call _mysqldump_to_gzip
+        # Call _mysqldump_to_gzip
+        result = self.mysql_dump._mysqldump_to_gzip("test")
+
+        # Verify result
+        output_file = os.path.join(self.backup_dir, "test.sql.gz")
+        self.assertEqual(result, output_file)
+
+        # Verify mysqldump is executed directly without a shell
+        mock_popen.assert_called_once()
+        self.assertEqual(
+            mock_popen.call_args[0][0],
+            ["mysqldump", "test", "--single-transaction", "--quick"]
+        )
+
+        # Verify the dump has been compressed to the output file
+        with gzip.open(output_file, 'rb') as f:
+            self.assertEqual(
+                f.read(),
+                b"CREATE TABLE t (id int);\nINSERT INTO t VALUES (1);\n-- Dump completed on 2023-01-01 12:00:00\n"
+            )
+
+        # Verify store_database_backup_time was called
+        self.mock_store_manager.store_database_backup_time.assert_called_once_with("test", ANY)
+
+    def test_mysqldump_to_gzip_external_compressor(self):
+        """Test _mysqldump_to_gzip compressing with an external compressor binary."""
+        self.mock_config.compressor_bin = "gzip"
+        dump = b"INSERT INTO t VALUES (1);\n-- Dump completed on 2023-01-01 12:00:00\n"
+
+        real_popen = subprocess.Popen
+        with patch('subprocess.Popen') as mock_popen:
+            # Only mock the mysqldump process, run the compressor for real
+            mysqldump_process = MagicMock()
+            mysqldump_process.returncode = 0
+            mysqldump_process.stdout.read.side_effect = [dump, b""]
+            mysqldump_process.stderr.read.return_value = b""
+            mysqldump_popen = MagicMock()
+            mysqldump_popen.__enter__.return_value = mysqldump_process
+            mock_popen.side_effect = lambda cmd, *args, **kwargs: (
+                mysqldump_popen if cmd[0] == "mysqldump" else real_popen(cmd, *args, **kwargs)
+            )
+
+            self.mock_config.skip_unchanged_dbs = False
             result = self.mysql_dump._mysqldump_to_gzip("test")
 
-            # Verify result
-            self.assertEqual(result, "/tmp/backup/test.sql.gz")
+        self.assertEqual(result, os.path.join(self.backup_dir, "test.sql.gz"))
+        self.assertEqual(mock_popen.call_args[0][0], ["gzip", "-c"])
+        with gzip.open(result, 'rb') as f:
+            self.assertEqual(f.read(), dump)
+
+    def test_mysqldump_to_gzip_external_compressor_fails(self):
+        """Test _mysqldump_to_gzip when the external compressor exits early."""
+        self.mock_config.compressor_bin = "false"
+        self.mock_config.skip_unchanged_dbs = False
+
+        real_popen = subprocess.Popen
+        with patch('subprocess.Popen') as mock_popen:
+            mysqldump_process = MagicMock()
+            mysqldump_process.returncode = 0
+            # Write more than fits into a pipe to make the compressor's exit visible while writing
+            mysqldump_process.stdout.read.side_effect = [b"x" * 1024 * 1024] * 4 + [b""]
+            mysqldump_process.stderr.read.return_value = b""
+            mysqldump_popen = MagicMock()
+            mysqldump_popen.__enter__.return_value = mysqldump_process
+            mock_popen.side_effect = lambda cmd, *args, **kwargs: (
+                mysqldump_popen if cmd[0] == "mysqldump" else real_popen(cmd, *args, **kwargs)
+            )
 
-            # Verify store_database_backup_time was called
-            self.mock_store_manager.store_database_backup_time.assert_called_once_with("test")
+            with self.assertRaises(Exception) as context:
+                self.mysql_dump._mysqldump_to_gzip("test")
 
-            # Verify temp file was removed
-            mock_remove.assert_called_once_with("/tmp/temp_file")
+        self.assertIn("false failed with return code 1", str(context.exception))
 
     @patch('subprocess.Popen')
     def test_mysqldump_to_gzip_failure(self, mock_popen):
         """Test _mysqldump_to_gzip with failed execution."""
-        # Setup mocks
-        mock_process = MagicMock()
-        mock_process.returncode = 1
-        mock_process.communicate.return_value = (None, b"Error message")
-        mock_popen.return_value.__enter__.return_value = mock_process
+        self._mock_mysqldump_process(mock_popen, [], stderr=b"Error message", returncode=1)
 
         # Setup mock for get_database_last_change and get_database_backup_time
         self.mysql_dump.mysql_info.get_database_last_change.return_value = datetime.now() - timedelta(hours=1)
         self.mock_store_manager.get_database_backup_time.return_value = datetime.now() - timedelta(hours=2)
 
-        # Mock tempfile.NamedTemporaryFile
-        with patch('tempfile.NamedTemporaryFile', return_value=MagicMock(name="/tmp/temp_file")):
-            # Call _mysqldump_to_gzip and expect exception
-            with self.assertRaises(Exception):
-                self.mysql_dump._mysqldump_to_gzip("test")
+        # Call _mysqldump_to_gzip and expect exception
+        with self.assertRaises(Exception):
+            self.mysql_dump._mysqldump_to_gzip("test")
+
+        # Verify error was logged
+        self.mock_logger.error.assert_called()
 
-            # Verify error was logged
-            self.mock_logger.error.assert_called()
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_no_completion_message(self, mock_popen):
+        """Test _mysqldump_to_gzip when the dump ends without the completion message."""
+        self._mock_mysqldump_process(mock_popen, [b"CREATE TABLE t (id int);\n"])
+
+        # Setup mock for get_database_last_change and get_database_backup_time
+        self.mysql_dump.mysql_info.get_database_last_change.return_value = datetime.now() - timedelta(hours=1)
+        self.mock_store_manager.get_database_backup_time.return_value = datetime.now() - timedelta(hours=2)
+
+        with self.assertRaises(Exception) as context:
+            self.mysql_dump._mysqldump_to_gzip("test")
+        self.assertIn("no completion message found", str(context.exception))
 
     def test_mysqldump_to_gzip_reuse_previous(self):
         """Test _mysqldump_to_gzip when previous backup is newer than last change."""
@@ -164,60 +404,87 @@ class TestMySQLDump(unittest.TestCase):
         # Verify no subprocess was called
         self.mock_logger.error.assert_not_called()
 
+    def test_mysqldump_to_gzip_reuse_previous_same_fingerprint(self):
+        """Test _mysqldump_to_gzip reuses the previous backup if the fingerprint is unchanged."""
+        self.mysql_dump.mysql_info.get_database_fingerprint.return_value = (1000, 2048)
+        self.mock_store_manager.get_database_fingerprint.return_value = (1000, 2048)
+
+        result = self.mysql_dump._mysqldump_to_gzip("test")
+
+        self.assertEqual(result, "ok")
+        self.mock_store_manager.reuse_previous_backup.assert_called_once_with("test")
+        self.mock_store_manager.store_database_fingerprint.assert_called_once_with("test", (1000, 2048))
+
     @patch('subprocess.Popen')
-    @patch('tempfile.NamedTemporaryFile')
-    @patch('os.path.exists')
-    @patch('os.remove')
-    def test_mysqldump_to_gzip_encoding_issue(self, mock_remove, mock_exists, mock_temp_file, mock_popen):
-        """Test _mysqldump_to_gzip with encoding issues in the completion message."""
-        # Setup mocks
-        mock_temp = MagicMock()
-        mock_temp.name = "/tmp/temp_file"
-        mock_temp_file.return_value.__enter__.return_value = mock_temp
+    def test_mysqldump_to_gzip_changed_fingerprint(self, mock_popen):
+        """Test _mysqldump_to_gzip dumps the database if the fingerprint has changed, e.g. a table was dropped."""
+        self._mock_mysqldump_process(mock_popen, [b"-- Dump completed on 2023-01-01 12:00:00\n"])
+        self.mysql_dump.mysql_info.get_database_fingerprint.return_value = (1000, 1024)
+        self.mock_store_manager.get_database_fingerprint.return_value = (1000, 2048)
 
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.communicate.return_value = (None, b"")
-        mock_popen.return_value.__enter__.return_value = mock_process
+        result = self.mysql_dump._mysqldump_to_gzip("test")
+
+        self.assertEqual(result, os.path.join(self.backup_dir, "test.sql.gz"))
+        self.mock_store_manager.reuse_previous_backup.assert_not_called()
+        self.mock_store_manager.store_database_fingerprint.assert_called_once_with("test", (1000, 1024))
+
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_incomplete_keeps_no_fingerprint(self, mock_popen):
+        """Test that an incomplete dump stores no fingerprint, so the next backup doesn't reuse it."""
+        self._mock_mysqldump_process(mock_popen, [b"CREATE TABLE t (id int);\n"])
+        self.mysql_dump.mysql_info.get_database_fingerprint.return_value = (1000, 1024)
+        self.mock_store_manager.get_database_fingerprint.return_value = (1000, 2048)
+
+        with self.assertRaises(Exception):
+            self.mysql_dump._mysqldump_to_gzip("test")
 
-        mock_exists.return_value = True
+        self.mock_store_manager.store_database_fingerprint.assert_not_called()
+
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_failed_dump_is_redone(self, mock_popen):
+        """Test that a dump which failed in the previous run is dumped again, not reused."""
+        backup_root = os.path.join(self.backup_dir, "backups")
+        os.mkdir(backup_root)
+        store_manager = StoreManager(backup_root)
+        self.mysql_dump.store_manager = store_manager
+        self.mysql_dump.mysql_info.get_database_fingerprint.return_value = (1000, 1024)
+        self.mysql_dump.mysql_info.get_database_last_change.return_value = datetime.now() - timedelta(hours=2)
+
+        # The first run dies before mysqldump has written the completion message
+        self._mock_mysqldump_process(mock_popen, [b"CREATE TABLE t (id int);\n"], returncode=1)
+        with self.assertRaises(Exception):
+            self.mysql_dump._mysqldump_to_gzip("test")
+
+        # The next run finds the database unchanged since then, but nothing to reuse
+        store_manager.previous_dir = store_manager.current_dir
+        store_manager.current_dir = get_dir_info(tempfile.mkdtemp(dir=backup_root))
+        self._mock_mysqldump_process(mock_popen, [b"-- Dump completed on 2023-01-01 12:00:00\n"])
+        result = self.mysql_dump._mysqldump_to_gzip("test")
+
+        self.assertEqual(result, os.path.join(store_manager.current_dir.path, "test.sql.gz"))
+        self.assertEqual(mock_popen.call_count, 2)
+
+    @patch('subprocess.Popen')
+    def test_mysqldump_to_gzip_encoding_issue(self, mock_popen):
+        """Test _mysqldump_to_gzip with encoding issues in the completion message."""
+        # Completion message with non-UTF8 character (0xb5 = µ in Latin-1), split across two chunks
+        self._mock_mysqldump_process(mock_popen, [
+            b"INSERT INTO t VALUES ('\xb5');\n-- Dump completed",
+            b" on 2023-01-01 12:00:00 \xb5\n",
+        ])
 
         # Setup mock for get_database_last_change and get_database_backup_time
         self.mysql_dump.mysql_info.get_database_last_change.return_value = datetime.now() - timedelta(hours=1)
         self.mock_store_manager.get_database_backup_time.return_value = datetime.now() - timedelta(hours=2)
 
-        # Mock open to return completion message with non-UTF8 character (0xb5 = µ in Latin-1)
-        completion_msg = b"-- Dump completed on 2023-01-01 12:00:00 \xb5"
-
-        # Create a mock that handles both text and binary mode
-        def mock_open_func(path, mode='r', **kwargs):
-            if 'b' in mode:
-                # Binary mode
-                mock_file = MagicMock()
-                mock_file.read.return_value = completion_msg
-                mock_file.__enter__.return_value = mock_file
-                mock_file.__exit__.return_value = None
-                return mock_file
-            else:
-                # Text mode - this should raise UnicodeDecodeError
-                raise UnicodeDecodeError('utf-8', completion_msg, 42, 43, 'invalid start byte')
-
-        with patch('builtins.open', side_effect=mock_open_func):
-            # Call _mysqldump_to_gzip
-            result = self.mysql_dump._mysqldump_to_gzip("test")
-
-            # Verify result
-            self.assertEqual(result, "/tmp/backup/test.sql.gz")
-
-            # Verify store_database_backup_time was called
-            self.mock_store_manager.store_database_backup_time.assert_called_once_with("test")
+        # Call _mysqldump_to_gzip
+        result = self.mysql_dump._mysqldump_to_gzip("test")
 
-            # Verify warning was logged about encoding issue
-            warning_calls = [call for call in self.mock_logger.warning.call_args_list]
-            self.assertTrue(any("Failed to read temp file with UTF-8 encoding" in str(call) for call in warning_calls))
+        # Verify result
+        self.assertEqual(result, os.path.join(self.backup_dir, "test.sql.gz"))
 
-            # Verify temp file was removed
-            mock_remove.assert_called_once_with("/tmp/temp_file")
+        # Verify store_database_backup_time was called
+        self.mock_store_manager.store_database_backup_time.assert_called_once_with("test", ANY)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,13 @@
 import unittest
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import patch, MagicMock
 from datetime import datetime
+import shutil
 import subprocess
+import tempfile
 import os
 
 # Assume dir_info.py and mysql_info.py are in the same directory or accessible via PYTHONPATH
+from dir_info import get_dir_size
 from mysql_info import MySQLInfo, encode_database_name
 
 
@@ -18,6 +21,11 @@ class MockDirInfo:
         return f"MockDirInfo(path='{self.path}')"
 
 
+def fingerprint_at(last_change):
+    """Return a directory fingerprint with the given last change."""
+    return int(last_change.timestamp()) * 1_000_000_000, 1024
+
+
 # Use the mock DirInfo if the real one isn't available/needed for basic tests
 # from dir_info import DirInfo # Use this if DirInfo is available and needed
 
@@ -68,30 +76,20 @@ class TestEncodeDatabaseName(unittest.TestCase):
 
 class TestMySQLInfo(unittest.TestCase):
 
-    @patch('mysql_info.get_dir_last_change')
+    @patch('mysql_info.get_dir_fingerprint')
     @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/var/lib/mysql'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_init_and_dependencies(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_last_change):
+    def test_init_and_dependencies(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_fingerprint):
         """
         Test initialization (__init__) and that dependencies are called correctly.
         """
         # --- Arrange ---
-        # Mock subprocess.run for get_data_dir
-        mock_data_dir_result = MagicMock()
-        mock_data_dir_result.stdout = '/var/lib/mysql\n'
-        mock_data_dir_result.check_returncode.return_value = None  # Simulate check=True passing
-
-        # Mock subprocess.run for get_databases
-        mock_db_list_result = MagicMock()
-        mock_db_list_result.stdout = (
-            'db1\ndb2\ninformation_schema\nsys\n\ndb3\nperformance_schema\nmysql\n')  # Added 'mysql' system db
-        mock_db_list_result.check_returncode.return_value = None  # Simulate check=True passing
-
-        # Configure subprocess.run to return different values based on call args
-        mock_subprocess_run.side_effect = [
-            mock_data_dir_result,  # First call (get_data_dir)
-            mock_db_list_result  # Second call (get_databases)
-        ]
+        # Mock subprocess.run for the data dir followed by the databases
+        mock_result = MagicMock()
+        mock_result.stdout = (
+            '/var/lib/mysql\ndb1\ndb2\ninformation_schema\nsys\n\ndb3\nperformance_schema\nmysql\n')
+        mock_result.check_returncode.return_value = None  # Simulate check=True passing
+        mock_subprocess_run.return_value = mock_result
 
         # Mock get_dir_info to return our mock DirInfo object with the correct path
         mock_dir_info_obj = MockDirInfo('/var/lib/mysql')
@@ -104,13 +102,11 @@ class TestMySQLInfo(unittest.TestCase):
         # Check mysql_bin attribute
         self.assertEqual(mysql_info.mysql_bin, 'custom_mysql')
 
-        # Check calls to subprocess.run
-        expected_calls = [
-            call(['custom_mysql', '-N', '-e', 'SELECT @@datadir'], check=True, capture_output=True, text=True),
-            call(['custom_mysql', '-e', 'show databases', '-N'], check=True, capture_output=True, text=True)
-        ]
-        mock_subprocess_run.assert_has_calls(expected_calls)
-        self.assertEqual(mock_subprocess_run.call_count, 2)
+        # Check the single call to subprocess.run
+        mock_subprocess_run.assert_called_once_with(
+            ['custom_mysql', '-N', '-e', 'SELECT @@datadir; SHOW DATABASES'],
+            check=True, capture_output=True, text=True
+        )
 
         # Check call to get_dir_info
         mock_get_dir_info.assert_called_once_with('/var/lib/mysql')
@@ -124,97 +120,61 @@ class TestMySQLInfo(unittest.TestCase):
         # Assuming original code filters: 'information_schema', 'sys', 'performance_schema'
         self.assertEqual(mysql_info.databases, ['db1', 'db2', 'db3', 'mysql'])
 
-        # Ensure get_dir_last_change was NOT called during init
-        mock_get_dir_last_change.assert_not_called()
+        # Ensure get_dir_fingerprint was NOT called during init
+        mock_get_dir_fingerprint.assert_not_called()
 
+    @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/path/to/data/dir'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_get_data_dir(self, mock_subprocess_run):
+    def test_get_data_dir(self, mock_subprocess_run, mock_get_dir_info):
         """
-        Test the get_data_dir method in isolation.
+        Test the get_data_dir method returns the queried data dir without querying again.
         """
         # --- Arrange ---
-        mock_result = MagicMock()
-        mock_result.stdout = ' /path/to/data/dir\n  '
-        mock_result.check_returncode.return_value = None
-        mock_subprocess_run.return_value = mock_result
-
-        # Need to bypass __init__'s calls for isolated test
-        with patch.object(MySQLInfo, 'get_databases', return_value=[]), \
-                patch('mysql_info.get_dir_info', return_value=MockDirInfo('/mock/path')):  # Use MockDirInfo
-
-            # Instantiate - this will call the mocked get_data_dir via __init__
-            instance = MySQLInfo(mysql_bin='mysql')
+        mock_subprocess_run.return_value = MagicMock(stdout=' /path/to/data/dir\ndb1\n  ')
+        instance = MySQLInfo(mysql_bin='mysql')
 
         # --- Act ---
-        # Call get_data_dir again explicitly to test its direct return value
         data_dir_path = instance.get_data_dir()
 
         # --- Assert ---
-        # Check the specific call for get_data_dir
-        get_data_dir_call = call(
-            ['mysql', '-N', '-e', 'SELECT @@datadir'],
-            check=True, capture_output=True, text=True
-        )
-        # It was called once during init and once explicitly
-        mock_subprocess_run.assert_has_calls([get_data_dir_call, get_data_dir_call])
-        self.assertEqual(mock_subprocess_run.call_count, 2)
-
-        # Check the *return value* of the explicit call
+        mock_get_dir_info.assert_called_once_with('/path/to/data/dir')
         self.assertEqual(data_dir_path, '/path/to/data/dir')
+        mock_subprocess_run.assert_called_once()
 
+    @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/mock/datadir'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_get_databases(self, mock_subprocess_run):
+    def test_get_databases(self, mock_subprocess_run, mock_get_dir_info):
         """
-        Test the get_databases method in isolation.
+        Test the get_databases method returns the queried databases without querying again.
         """
         # --- Arrange ---
-        mock_result = MagicMock()
         # Include system DBs and empty lines in mock output
-        mock_result.stdout = 'db_alpha\ndb_beta\n\ninformation_schema\nperformance_schema\nsys\ndb_gamma\n'
-        mock_result.check_returncode.return_value = None
-        mock_subprocess_run.return_value = mock_result
-
-        # Need to bypass __init__'s calls for isolated test
-        with patch.object(MySQLInfo, 'get_data_dir', return_value='/mock/datadir'), \
-                patch('mysql_info.get_dir_info', return_value=MockDirInfo('/mock/datadir')):  # Use MockDirInfo
-
-            # Instantiate - this will call the mocked get_databases via __init__
-            instance = MySQLInfo(mysql_bin='mysql')
+        mock_subprocess_run.return_value = MagicMock(
+            stdout='/mock/datadir\ndb_alpha\ndb_beta\n\ninformation_schema\nperformance_schema\nsys\ndb_gamma\n')
+        instance = MySQLInfo(mysql_bin='mysql')
 
         # --- Act ---
-        # Call get_databases again explicitly to test its direct return value
         databases = instance.get_databases()
 
         # --- Assert ---
-        # Check the specific call for get_databases
-        get_databases_call = call(
-            ['mysql', '-e', 'show databases', '-N'],
-            check=True, capture_output=True, text=True
-        )
-        # It was called once during init and once explicitly
-        mock_subprocess_run.assert_has_calls([get_databases_call, get_databases_call])
-        self.assertEqual(mock_subprocess_run.call_count, 2)
-
-        # Check the *return value* of the explicit call (filtering applied)
         self.assertEqual(databases, ['db_alpha', 'db_beta', 'db_gamma'])
+        mock_subprocess_run.assert_called_once()
 
-    @patch('mysql_info.get_dir_last_change')
+    @patch('mysql_info.get_dir_fingerprint')
     @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/base/data/path'))  # Use MockDirInfo
     @patch('subprocess.run')
     def test_get_database_last_change_with_special_chars(self, mock_subprocess_run, mock_get_dir_info,
-                                                         mock_get_dir_last_change):
+                                                         mock_get_dir_fingerprint):
         """
         Test the get_database_last_change method with database names containing special characters.
         """
         # --- Arrange ---
         # Mock subprocess for __init__ calls
-        mock_data_dir_result = MagicMock(stdout='/base/data/path\n')
-        mock_db_list_result = MagicMock(stdout='db1\nsnipeit-fairmate\ntest.db\n')
-        mock_subprocess_run.side_effect = [mock_data_dir_result, mock_db_list_result]
+        mock_subprocess_run.return_value = MagicMock(stdout='/base/data/path\ndb1\nsnipeit-fairmate\ntest.db\n')
 
-        # Mock the return value for get_dir_last_change
+        # Mock the fingerprint the last change is taken from
         expected_datetime = datetime(2023, 10, 27, 10, 30, 0)
-        mock_get_dir_last_change.return_value = expected_datetime
+        mock_get_dir_fingerprint.return_value = fingerprint_at(expected_datetime)
 
         # Instantiate the class
         mysql_info = MySQLInfo()  # Uses mocks set up above
@@ -228,30 +188,23 @@ class TestMySQLInfo(unittest.TestCase):
         # Verify get_dir_info was called during init
         mock_get_dir_info.assert_called_once_with('/base/data/path')
 
-        # Verify get_dir_last_change was called with the ENCODED database name
+        # Verify get_dir_fingerprint was called with the ENCODED database name
         expected_encoded_path = os.path.join('/base/data/path', 'snipeit@002dfairmate')
-        mock_get_dir_last_change.assert_called_once_with(expected_encoded_path)
+        mock_get_dir_fingerprint.assert_called_once_with(expected_encoded_path)
 
         # Verify the returned datetime
         self.assertEqual(last_change_time, expected_datetime)
 
-    @patch('mysql_info.get_dir_info')
+    @patch('mysql_info.get_dir_size', return_value=1024000)
+    @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/base/data/path'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_get_database_size_with_special_chars(self, mock_subprocess_run, mock_get_dir_info):
+    def test_get_database_size_with_special_chars(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_size):
         """
         Test the get_database_size method with database names containing special characters.
         """
         # --- Arrange ---
         # Mock subprocess for __init__ calls
-        mock_data_dir_result = MagicMock(stdout='/base/data/path\n')
-        mock_db_list_result = MagicMock(stdout='test-db\ntest.db\n')
-        mock_subprocess_run.side_effect = [mock_data_dir_result, mock_db_list_result]
-
-        # Mock get_dir_info for both init and get_database_size calls
-        mock_dir_info_init = MockDirInfo('/base/data/path')
-        mock_dir_info_db = MagicMock()
-        mock_dir_info_db.bytes_used = 1024000
-        mock_get_dir_info.side_effect = [mock_dir_info_init, mock_dir_info_db]
+        mock_subprocess_run.return_value = MagicMock(stdout='/base/data/path\ntest-db\ntest.db\n')
 
         # Instantiate the class
         mysql_info = MySQLInfo()
@@ -262,31 +215,28 @@ class TestMySQLInfo(unittest.TestCase):
         db_size = mysql_info.get_database_size(db_name)
 
         # --- Assert ---
-        # Verify get_dir_info was called with the ENCODED database name
-        expected_encoded_path = os.path.join('/base/data/path', 'test@002ddb')
-        calls = mock_get_dir_info.call_args_list
-        self.assertEqual(calls[0][0][0], '/base/data/path')  # First call from init
-        self.assertEqual(calls[1][0][0], expected_encoded_path)  # Second call from get_database_size
+        # Verify get_dir_info was called for the data dir only
+        mock_get_dir_info.assert_called_once_with('/base/data/path')
+        # Verify get_dir_size was called with the ENCODED database name
+        mock_get_dir_size.assert_called_once_with(os.path.join('/base/data/path', 'test@002ddb'))
 
         # Verify the returned size
         self.assertEqual(db_size, 1024000)
 
-    @patch('mysql_info.get_dir_last_change')
+    @patch('mysql_info.get_dir_fingerprint')
     @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/base/data/path'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_get_database_last_change(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_last_change):
+    def test_get_database_last_change(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_fingerprint):
         """
         Test the get_database_last_change method.
         """
         # --- Arrange ---
         # Mock subprocess for __init__ calls
-        mock_data_dir_result = MagicMock(stdout='/base/data/path\n')
-        mock_db_list_result = MagicMock(stdout='db1\ndb2\n')
-        mock_subprocess_run.side_effect = [mock_data_dir_result, mock_db_list_result]
+        mock_subprocess_run.return_value = MagicMock(stdout='/base/data/path\ndb1\ndb2\n')
 
-        # Mock the return value for get_dir_last_change
+        # Mock the fingerprint the last change is taken from
         expected_datetime = datetime(2023, 10, 27, 10, 30, 0)
-        mock_get_dir_last_change.return_value = expected_datetime
+        mock_get_dir_fingerprint.return_value = fingerprint_at(expected_datetime)
 
         # Instantiate the class
         mysql_info = MySQLInfo()  # Uses mocks set up above
@@ -299,38 +249,76 @@ class TestMySQLInfo(unittest.TestCase):
         # Verify get_dir_info was called during init
         mock_get_dir_info.assert_called_once_with('/base/data/path')
 
-        # Verify get_dir_last_change was called correctly
+        # Verify get_dir_fingerprint was called correctly
         expected_db_path = os.path.join('/base/data/path', db_name)
-        mock_get_dir_last_change.assert_called_once_with(expected_db_path)
+        mock_get_dir_fingerprint.assert_called_once_with(expected_db_path)
 
         # Verify the returned datetime
         self.assertEqual(last_change_time, expected_datetime)
 
-    @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/var/lib/mysql'))  # Use MockDirInfo
+    @patch('mysql_info.get_dir_size', return_value=1024000)
+    @patch('mysql_info.get_dir_fingerprint')
+    @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/base/data/path'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_subprocess_error_get_data_dir(self, mock_subprocess_run, mock_get_dir_info):
-        """ Test that CalledProcessError in get_data_dir propagates """
+    def test_database_info_is_cached(self, mock_subprocess_run, mock_get_dir_info, mock_get_dir_fingerprint,
+                                     mock_get_dir_size):
+        """
+        Test that the size and last change of a database are read from the filesystem only once.
+        """
         # --- Arrange ---
-        mock_subprocess_run.side_effect = subprocess.CalledProcessError(1, 'cmd', stderr='Error accessing mysql')
+        mock_subprocess_run.return_value = MagicMock(stdout='/base/data/path\ndb1\n')
+        mock_get_dir_fingerprint.return_value = fingerprint_at(datetime(2023, 10, 27, 10, 30, 0))
+        mysql_info = MySQLInfo()
 
-        # --- Act & Assert ---
-        with self.assertRaises(subprocess.CalledProcessError):
-            MySQLInfo()  # Error should occur during __init__ when calling get_data_dir
+        # --- Act ---
+        sizes = [mysql_info.get_database_size('db1'), mysql_info.get_databases_size(['db1'])]
+        last_changes = [mysql_info.get_database_last_change('db1'), mysql_info.get_database_last_change('db1')]
+
+        # --- Assert ---
+        self.assertEqual(sizes, [1024000, 1024000])
+        self.assertEqual(last_changes, [datetime(2023, 10, 27, 10, 30, 0)] * 2)
+        mock_get_dir_size.assert_called_once()
+        mock_get_dir_fingerprint.assert_called_once()
+
+    @patch('mysql_info.get_dir_info')
+    @patch('subprocess.run')
+    def test_get_databases_sizes(self, mock_subprocess_run, mock_get_dir_info):
+        """
+        Test that get_databases_sizes finds all database directories with a single listing of the data dir.
+        """
+        # --- Arrange ---
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        for encoded_name in ['db1', 'test@002ddb', 'other']:
+            os.makedirs(os.path.join(data_dir, encoded_name))
+            with open(os.path.join(data_dir, encoded_name, 't.ibd'), 'wb') as f:
+                f.write(b'x' * 10000)
+        mock_subprocess_run.return_value = MagicMock(stdout=data_dir + '\ndb1\ntest-db\n')
+        mock_get_dir_info.return_value = MockDirInfo(data_dir)
+        mysql_info = MySQLInfo()
+
+        # --- Act ---
+        sizes = mysql_info.get_databases_sizes(['db1', 'test-db'])
+
+        # --- Assert ---
+        self.assertEqual(sizes, {
+            'db1': get_dir_size(os.path.join(data_dir, 'db1')),
+            'test-db': get_dir_size(os.path.join(data_dir, 'test@002ddb')),
+        })
+        # Only the data dir itself has been looked up by get_dir_info
+        mock_get_dir_info.assert_called_once_with(data_dir)
 
     @patch('mysql_info.get_dir_info', return_value=MockDirInfo('/var/lib/mysql'))  # Use MockDirInfo
     @patch('subprocess.run')
-    def test_subprocess_error_get_databases(self, mock_subprocess_run, mock_get_dir_info):
-        """ Test that CalledProcessError in get_databases propagates """
+    def test_subprocess_error(self, mock_subprocess_run, mock_get_dir_info):
+        """ Test that CalledProcessError of the mysql client propagates """
         # --- Arrange ---
-        mock_data_dir_result = MagicMock(stdout='/var/lib/mysql\n')
-        mock_subprocess_run.side_effect = [
-            mock_data_dir_result,  # First call (get_data_dir) succeeds
-            subprocess.CalledProcessError(1, 'cmd', stderr='Error showing databases')  # Second call fails
-        ]
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(1, 'cmd', stderr='Error accessing mysql')
 
         # --- Act & Assert ---
         with self.assertRaises(subprocess.CalledProcessError):
-            MySQLInfo()  # Error should occur during __init__ when calling get_databases
+            MySQLInfo()  # Error should occur during __init__ when querying the server
+        mock_get_dir_info.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -1,3 +1,5 @@
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 from datetime import datetime
@@ -6,8 +8,9 @@ from store_manager import StoreManager  # Assuming StoreManager is the class con
 
 class TestStoreManager(unittest.TestCase):
     def setUp(self):
-        # Provide a mock backup directory path
-        backup_dir = '/tmp'
+        # Provide a private backup directory, so no backup directory is left behind in /tmp
+        backup_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backup_dir)
 
         # Setup a StoreManager instance with the backup_dir parameter
         self.store_manager = StoreManager(backup_dir=backup_dir)
@@ -41,6 +44,42 @@ class TestStoreManager(unittest.TestCase):
         self.assertEqual(result, expected_time)
         mock_join.assert_called_once_with('/mock/path', 'database.timestamp')
 
+    def test_database_fingerprint(self):
+        """Test that a stored fingerprint is read back by the next backup"""
+        self.store_manager.store_database_fingerprint('db1', (1696161600000000000, 1024))
+        self.store_manager.previous_dir.path = self.store_manager.current_dir.path
+        self.assertEqual(self.store_manager.get_database_fingerprint('db1'), (1696161600000000000, 1024))
+
+    def test_database_fingerprint_not_found(self):
+        """Test that a previous backup without fingerprint returns None"""
+        self.assertIsNone(self.store_manager.get_database_fingerprint('db1'))
+
+    @patch('store_manager.shutil.rmtree')
+    @patch('store_manager.glob.glob')
+    def test_backup_dirs_listed_once(self, mock_glob, mock_rmtree):
+        """Test that the backup dir is listed only once and the listing is updated on cleanup"""
+        self.store_manager.backup_dir = '/backup'
+        self.store_manager._backup_dirs = None
+        mock_glob.return_value = [
+            '/backup/oma_20231002-120000',
+            '/backup/oma_20231001-120000',
+            '/backup/oma_20231003-120000',
+        ]
+
+        removed = self.store_manager.cleanup_after(versions=2)
+        self.assertEqual(removed, ['/backup/oma_20231001-120000'])
+
+        # The removed directory is gone from the listing without listing the backup dir again
+        self.assertEqual(self.store_manager._get_backup_dirs(), [
+            '/backup/oma_20231002-120000',
+            '/backup/oma_20231003-120000',
+        ])
+        mock_glob.assert_called_once()
+
+    def test_current_dir_in_backup_dirs(self):
+        """Test that the newly created backup directory is part of the listing"""
+        self.assertEqual(self.store_manager._get_backup_dirs()[-1], self.store_manager.current_dir.path)
+
     @patch('store_manager.shutil.rmtree')
     @patch('store_manager.os.rename')
     def test_remove_skipped(self, mock_rename, mock_rmtree):
@@ -107,6 +146,8 @@ class TestStoreManager(unittest.TestCase):
         """Test that cleanup_before refreshes current_dir.bytes_free after removing directories"""
         # Setup: simulate 3 existing backup dirs, versions=2 means 1 should be removed
         self.store_manager.backup_dir = '/backup'
+        # Forget the cached listing of the real backup dir
+        self.store_manager._backup_dirs = None
         self.store_manager.current_dir = MagicMock()
         self.store_manager.current_dir.path = '/backup/oma_20231003-120000'
 
@@ -142,6 +183,8 @@ class TestStoreManager(unittest.TestCase):
         """Test that cleanup_before does NOT refresh current_dir when no directories are removed"""
         # Setup: only 2 backup dirs, versions=2 means nothing should be removed
         self.store_manager.backup_dir = '/backup'
+        # Forget the cached listing of the real backup dir
+        self.store_manager._backup_dirs = None
         original_current_dir = MagicMock()
         original_current_dir.path = '/backup/oma_20231002-120000'
         original_current_dir.bytes_free = 100000000000  # 100 GB
@@ -136,5 +136,66 @@ class TestCalcParallelism(unittest.TestCase):
         self.assertEqual(utils.calc_parallelism(-10), 1)
 
 
+class TestCalcCompressorThreads(unittest.TestCase):
+    """Test the calc_compressor_threads function."""
+
+    @mock.patch('multiprocessing.cpu_count', return_value=8)
+    def test_split_cpus(self, mock_cpu_count):
+        """Test that CPUs are split among the parallel processes."""
+        self.assertEqual(utils.calc_compressor_threads(1), 8)
+        self.assertEqual(utils.calc_compressor_threads(2), 4)
+        self.assertEqual(utils.calc_compressor_threads(3), 2)
+
+    @mock.patch('multiprocessing.cpu_count', return_value=8)
+    def test_more_processes_than_cpus(self, mock_cpu_count):
+        """Test that at least one thread is used."""
+        self.assertEqual(utils.calc_compressor_threads(16), 1)
+
+
+class TestDropFileCache(unittest.TestCase):
+    """Test the drop_file_cache function."""
+
+    @unittest.skipUnless(hasattr(os, 'posix_fadvise'), "posix_fadvise not available")
+    @mock.patch('os.posix_fadvise')
+    @mock.patch('os.fdatasync')
+    def test_drop_without_sync(self, mock_fdatasync, mock_fadvise):
+        """Test that by default the pages are dropped without waiting for the file to be written to disk."""
+        utils.drop_file_cache(5)
+
+        mock_fdatasync.assert_not_called()
+        mock_fadvise.assert_called_once_with(5, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    @unittest.skipUnless(hasattr(os, 'posix_fadvise'), "posix_fadvise not available")
+    @mock.patch('os.posix_fadvise')
+    @mock.patch('os.fdatasync')
+    def test_sync_before_drop(self, mock_fdatasync, mock_fadvise):
+        """Test that with sync the file is written to disk before its pages are dropped."""
+        calls = mock.Mock()
+        calls.attach_mock(mock_fdatasync, 'fdatasync')
+        calls.attach_mock(mock_fadvise, 'posix_fadvise')
+
+        utils.drop_file_cache(5, sync=True)
+
+        self.assertEqual(calls.mock_calls, [
+            mock.call.fdatasync(5),
+            mock.call.posix_fadvise(5, 0, 0, os.POSIX_FADV_DONTNEED),
+        ])
+
+    @unittest.skipUnless(hasattr(os, 'posix_fadvise'), "posix_fadvise not available")
+    def test_closed_file(self):
+        """Test that errors, e.g. of an invalid file descriptor, are ignored."""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(path)
+        utils.drop_file_cache(fd, sync=True)
+
+    def test_without_posix_fadvise(self):
+        """Test that nothing happens on systems without posix_fadvise."""
+        with mock.patch.object(utils, 'os', wraps=os) as mock_os:
+            del mock_os.posix_fadvise
+            utils.drop_file_cache(5, sync=True)
+            mock_os.fdatasync.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
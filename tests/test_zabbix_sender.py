@@ -15,9 +15,18 @@ from logger import new_logger  # noqa: E402
 
 
 class TestZabbixSender(unittest.TestCase):
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         # Create a sample backup result for testing
-        self.backup_result = BackupResult(total=5, successful=3, failed=1, skipped=1)
+        cls.backup_result = BackupResult(total=5, successful=3, failed=1, skipped=1)
+
+    def setUp(self):
+        # No test must start zabbix_sender, the sender runs this mock instead
+        self.mock_run = MagicMock()
+        # Don't wait for the retry back-off
+        sleep_patcher = patch('zabbix_sender.sleep')
+        sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
 
         # Create a temporary log file for testing
         with NamedTemporaryFile(mode='w', delete=False, suffix='.log') as f:
@@ -31,28 +40,27 @@ class TestZabbixSender(unittest.TestCase):
             sender_bin='zabbix_sender',
             agent_conf='/etc/zabbix/zabbix_agent.conf',
         )
-        self.sender = ZabbixSender(zbx_config, self.logger)
+        self.sender = ZabbixSender(zbx_config, self.logger, runner=self.mock_run)
 
     def tearDown(self):
         # Clean up the temporary log file
         if os.path.exists(self.log_file):
             os.unlink(self.log_file)
 
-    @patch('subprocess.run')
-    def test_send_value(self, mock_run):
+    def test_send_value(self):
         """Test sending a simple value to Zabbix."""
         # Setup mock
         mock_process = MagicMock()
         mock_process.returncode = 0
         mock_process.stdout = "Processed: 1; Failed: 0; Total: 1"
         mock_process.stderr = ""
-        mock_run.return_value = mock_process
+        self.mock_run.return_value = mock_process
 
         # Call the method
         self.sender.send_value("success")
 
         # Verify subprocess.run was called with correct arguments
-        mock_run.assert_called_once_with(
+        self.mock_run.assert_called_once_with(
             [
                 'zabbix_sender',
                 '-c',
@@ -66,15 +74,14 @@ class TestZabbixSender(unittest.TestCase):
             text=True
         )
 
-    @patch('subprocess.run')
-    def test_send_value_error(self, mock_run):
+    def test_send_value_error(self):
         """Test error handling when sending a value fails."""
         # Setup mock to simulate failure
         mock_process = MagicMock()
         mock_process.returncode = 1
         mock_process.stdout = "Failed output"
         mock_process.stderr = "Connection refused"
-        mock_run.return_value = mock_process
+        self.mock_run.return_value = mock_process
 
         # Call the method
         self.sender.set_retires(1)
@@ -86,13 +93,12 @@ class TestZabbixSender(unittest.TestCase):
         self.assertIn("Connection refused", log_content)
         self.assertIn("Failed output", log_content)
 
-    @patch('subprocess.run')
-    def test_send_log_file_small(self, mock_run):
+    def test_send_log_file_small(self):
         """Test sending a small log file that doesn't need truncation."""
         # Setup mock
         mock_process = MagicMock()
         mock_process.returncode = 0
-        mock_run.return_value = mock_process
+        self.mock_run.return_value = mock_process
 
         # Add some content to the log
         self.logger.info("Small test log content")
@@ -102,10 +108,10 @@ class TestZabbixSender(unittest.TestCase):
         self.sender.send_log_file(self.backup_result)
 
         # Verify subprocess.run was called
-        mock_run.assert_called_once()
+        self.mock_run.assert_called_once()
 
         # Get the actual content that was sent
-        sent_content = mock_run.call_args[0][0][6]
+        sent_content = self.mock_run.call_args[0][0][6]
 
         # Verify the summary is included
         self.assertIn("Summary: Successfully dumped 3 of 5 databases", sent_content)
@@ -118,13 +124,12 @@ class TestZabbixSender(unittest.TestCase):
         # Verify no truncation message
         self.assertNotIn("has been truncated", sent_content)
 
-    @patch('subprocess.run')
-    def test_send_log_file_large(self, mock_run):
+    def test_send_log_file_large(self):
         """Test sending a large log file that needs truncation."""
         # Setup mock
         mock_process = MagicMock()
         mock_process.returncode = 0
-        mock_run.return_value = mock_process
+        self.mock_run.return_value = mock_process
 
         # Create a large log content
         # Each line is about 100 chars, so we need ~700 lines to exceed 65536 bytes
@@ -135,19 +140,39 @@ class TestZabbixSender(unittest.TestCase):
         self.sender.send_log_file(self.backup_result)
 
         # Verify subprocess.run was called
-        mock_run.assert_called_once()
+        self.mock_run.assert_called_once()
 
         # Get the actual content that was sent
-        sent_content = mock_run.call_args[0][0][6]
+        sent_content = self.mock_run.call_args[0][0][6]
 
         # Verify the content was truncated
         self.assertLess(len(sent_content), 65536)
         self.assertIn("has been truncated", sent_content)
         self.assertIn(self.log_file, sent_content)  # Should mention the log file path
+        # The log is cut at the end of a line
+        self.assertTrue(sent_content.split("\n\n** Zabbix")[0].endswith("x" * 50))
 
         # Verify summary is still included
         self.assertIn("Summary: Successfully dumped 3 of 5 databases", sent_content)
 
+    def test_send_log_file_no_log_file(self):
+        """Test that only the summary is sent if there is no log file."""
+        logger = MagicMock(log_file=None)
+        logger.read_log.return_value = ""
+        zbx_config = ZbxConfig(
+            item_key='mysql.backup.status',
+            sender_bin='zabbix_sender',
+            agent_conf='/etc/zabbix/zabbix_agent.conf',
+        )
+        sender = ZabbixSender(zbx_config, logger, runner=self.mock_run)
+        self.mock_run.return_value.returncode = 0
+
+        sender.send_log_file(self.backup_result)
+
+        sent_content = self.mock_run.call_args[0][0][6]
+        self.assertTrue(sent_content.startswith("Summary: Successfully dumped 3 of 5 databases"))
+        self.assertTrue(sent_content.endswith("\n(no log file)"))
+
     def test_send_value_no_item_key(self):
         """Test that send_value does nothing when item_key is empty."""
         # Create sender with no item key
@@ -156,12 +181,11 @@ class TestZabbixSender(unittest.TestCase):
             sender_bin='zabbix_sender',
             agent_conf='/etc/zabbix/zabbix_agent.conf',
         )
-        sender = ZabbixSender(zbx_config, self.logger)
+        sender = ZabbixSender(zbx_config, self.logger, runner=self.mock_run)
 
-        with patch('subprocess.run') as mock_run:
-            sender.send_value("test")
-            # Should not call subprocess.run
-            mock_run.assert_not_called()
+        sender.send_value("test")
+        # Should not call subprocess.run
+        self.mock_run.assert_not_called()
 
     def test_send_log_file_no_item_key(self):
         """Test that send_log_file does nothing when item_key is empty."""
@@ -171,12 +195,11 @@ class TestZabbixSender(unittest.TestCase):
             sender_bin='zabbix_sender',
             agent_conf='/etc/zabbix/zabbix_agent.conf',
         )
-        sender = ZabbixSender(zbx_config, self.logger)
+        sender = ZabbixSender(zbx_config, self.logger, runner=self.mock_run)
 
-        with patch('subprocess.run') as mock_run:
-            sender.send_log_file(self.backup_result)
-            # Should not call subprocess.run
-            mock_run.assert_not_called()
+        sender.send_log_file(self.backup_result)
+        # Should not call subprocess.run
+        self.mock_run.assert_not_called()
 
 
 if __name__ == '__main__':
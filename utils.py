@@ -54,3 +54,35 @@ def calc_parallelism(desired: int) -> int:
     if multiprocessing.cpu_count() + desired > 0:
         return multiprocessing.cpu_count() + desired
     return 1
+
+
+def calc_compressor_threads(parallelism: int) -> int:
+    """
+    Calculate the number of threads of a parallel compressor per mysqldump process,
+    so that all compressors together don't use more threads than CPUs are available.
+    :param parallelism: Number of parallel mysqldump processes
+    :return: Number of compressor threads, at least 1
+    """
+    return max(1, multiprocessing.cpu_count() // max(1, parallelism))
+
+
+def drop_file_cache(fd: int, sync: bool = False):
+    """
+    Advise the kernel to drop the cached pages of a file, so large backup files don't push the pages
+    of the database out of the page cache.
+    The kernel only drops pages that are already written to disk. For dirty pages it just starts the
+    writeback without waiting for it, so they are dropped by a later call. With sync, the data is
+    written to disk first, so all pages can be dropped; do this once, when the file is complete.
+    Does nothing on systems without posix_fadvise.
+    :param fd: File descriptor of the file
+    :param sync: Write the data of the file to disk and wait for it before dropping the pages
+    :return: None
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        if sync:
+            os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
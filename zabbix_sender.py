@@ -1,5 +1,7 @@
+import os
 import subprocess
 from time import sleep
+from typing import Callable
 
 from mysql_dump import BackupResult
 from config import ZbxConfig
@@ -7,12 +9,16 @@ from logger import OmaLogger
 
 
 class ZabbixSender:
-    def __init__(self, zbx_config: ZbxConfig, logger: OmaLogger):
+    def __init__(self, zbx_config: ZbxConfig, logger: OmaLogger, runner: Callable = subprocess.run):
         self.sender_bin = zbx_config.sender_bin
         self.agent_conf = zbx_config.agent_conf
         self.item_key = zbx_config.item_key
         self.logger = logger
         self.retries = 10
+        # Runs zabbix_sender with the signature of subprocess.run, tests pass a fake
+        self._runner = runner
+        # Everything but the value is the same for all calls of zabbix_sender
+        self._cmd_prefix = [self.sender_bin, '-c', self.agent_conf, '-k', self.item_key, '-o']
 
     def set_retires(self, retires: int):
         self.retries = retires
@@ -20,17 +26,9 @@ class ZabbixSender:
     def send_value(self, item_value: str):
         if not self.item_key:
             return
-        cmd = [
-            self.sender_bin,
-            '-c',
-            self.agent_conf,
-            '-k',
-            self.item_key,
-            '-o',
-            item_value
-        ]
+        cmd = self._cmd_prefix + [item_value]
         for i in range(self.retries):
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = self._runner(cmd, capture_output=True, text=True)
             stdout = result.stdout.replace('\r\n', '').replace('\n', '').replace('\r', '')
             stderr = result.stderr.replace('\r\n', '').replace('\n', '').replace('\r', '')
             exit_code = result.returncode
@@ -63,19 +61,19 @@ class ZabbixSender:
                 f"Summary: Successfully dumped {backup_result.successful} of {backup_result.total} databases. "
                 f"Skipped {backup_result.skipped}, Failed {backup_result.failed}. Error=0"
             )
-        # with open(self.logger.log_file, 'r', encoding='utf-8') as f:
-        file_content = summary + "\n" + self.logger.read_log()
+        # Anything beyond max_bytes would be truncated anyway, so don't read it
+        log_content = self.logger.read_log(max_bytes)
+        if not log_content:
+            # Nothing to append or truncate
+            if not (self.logger.log_file and os.path.exists(self.logger.log_file)):
+                summary += "\n(no log file)"
+            self.send_value(summary)
+            return
+        file_content = summary + "\n" + log_content
         if len(file_content) < max_bytes:
             self.send_value(file_content)
             return
-        # Subtract the size of the message to leave room to append it later without exceeding the max.
-        max_bytes -= len(message)
-        # Split log file into lines and append lines until max bytes have been reached.
-        log_lines = file_content.splitlines()
-        truncated_log_lines = ""
-        for line in log_lines:
-            if len(truncated_log_lines) + len(line) > max_bytes:
-                break
-            truncated_log_lines += f" {line}\n"
-        truncated_log_lines += message
-        self.send_value(truncated_log_lines)
+        # Leave room for the message and cut the log at the last line that fits.
+        head = file_content[:max_bytes - len(message)]
+        cut = head.rfind('\n')
+        self.send_value((head if cut < 0 else head[:cut]) + '\n' + message)